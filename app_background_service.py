@@ -1,13 +1,14 @@
+import time
+START_TIME = time.perf_counter()  # for measuring startup cost
+
+import gc
 import os
 import queue
+from collections import deque
 import sys
-import tempfile
 import threading
-import time
-import wave
 import json
 import sqlite3
-from datetime import datetime
 from pathlib import Path
 import tkinter as tk
 from tkinter import font
@@ -18,11 +19,22 @@ import pystray
 import sounddevice as sd
 from PIL import Image, ImageDraw
 
+from audio_archive import AudioArchive
+from audio_buffer import AudioBuffer, PrerollRing, to_float32
+from engines import DECODING_PROFILES, create_engine, decoding_options
+from long_form import ChunkWorkers, transcribe_long
+from metrics import wakeup_rate
+from refiner import Refiner
+from resample import PolyphaseResampler
+import storage
+from vad import trim_silence
+
 # keyboard can require elevated privileges on Windows in some cases
 import keyboard
 
-# Whisper (OpenAI) - PyTorch implementation
-import whisper
+# The transcription engine (torch/whisper or another runtime) is imported by
+# load_model() in a background thread; importing it here would add seconds
+# to startup before the tray appears
 
 # Set process name for Task Manager
 try:
@@ -33,35 +45,419 @@ except ImportError:
 
 # Configuration
 HOTKEY = 'ctrl+win'
-SAMPLE_RATE = 16000
+SAMPLE_RATE = 16000  # what the model takes; capture is resampled to this as it arrives
 CHANNELS = 1
-
-# GPU/Device settings
-import torch
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Using device: {DEVICE}")
+CAPTURE_RATE = int(os.environ.get('CAPTURE_RATE', '0'))  # microphone rate, 0 = the device's native rate
+
+# Armed capture: keep one input stream open and prepend the last PREROLL_MS of
+# audio to each recording, so pressing the hotkey costs no stream setup and the
+# first syllable is never clipped. The callback's share of one core is checked
+# against ARMED_CPU_BUDGET (percent)
+ARMED_CAPTURE = os.environ.get('ARMED_CAPTURE', '0') == '1'
+PREROLL_MS = int(os.environ.get('PREROLL_MS', '300'))
+ARMED_BLOCK_MS = int(os.environ.get('ARMED_BLOCK_MS', '50'))  # larger blocks = fewer wakeups while idle
+ARMED_CPU_BUDGET = float(os.environ.get('ARMED_CPU_BUDGET', '1'))
+MAX_RECORDING_SECONDS = float(os.environ.get('MAX_RECORDING_SECONDS', '600'))
 
 # Data storage
 APP_DATA_DIR = Path(os.path.expanduser('~')) / '.voz-pra-texto'
 DB_PATH = APP_DATA_DIR / 'transcriptions.db'
 AUDIO_DIR = APP_DATA_DIR / 'audio_files'
 
+# Streaming mode: transcribe completed windows while the hotkey is still held
+STREAMING = os.environ.get('STREAMING', '0') == '1'
+STREAM_WINDOW = float(os.environ.get('STREAM_WINDOW', '5'))  # seconds between interim passes
+
+# Voice activity detection: trim silence before it reaches the model
+VAD_ENABLED = os.environ.get('VAD', '1') == '1'
+VAD_MARGIN_DB = float(os.environ.get('VAD_MARGIN_DB', '15'))      # dB above the noise floor
+VAD_FLOOR_DB = float(os.environ.get('VAD_FLOOR_DB', '-50'))       # absolute minimum speech level (dBFS)
+VAD_SPEECH_DB = float(os.environ.get('VAD_SPEECH_DB', '-30'))     # always speech above this, however noisy
+VAD_MIN_SPEECH_MS = int(os.environ.get('VAD_MIN_SPEECH_MS', '250'))
+VAD_PAD_MS = int(os.environ.get('VAD_PAD_MS', '200'))
+VAD_MAX_PAUSE_MS = int(os.environ.get('VAD_MAX_PAUSE_MS', '1000'))
+
+# Warm-up: run dummy audio through the model after loading (and optionally
+# again whenever it has been idle this long) so real utterances hit a warm path
+WARMUP = os.environ.get('WARMUP', '0') == '1'
+WARMUP_LENGTHS = [float(x) for x in os.environ.get('WARMUP_LENGTHS', '2,8').split(',')]  # seconds
+WARMUP_IDLE_MINUTES = float(os.environ.get('WARMUP_IDLE_MINUTES', '0'))  # 0 = only once after load
+
+# Stages recorded per utterance, in pipeline order (see stage_latency_report)
+TRACE_STAGES = ['stream_stop', 'capture', 'queue_wait', 'model_load', 'vad', 'language_detection', 'decode', 'transcribe',
+                'clipboard', 'paste', 'total']
+
+# Long-form mode: speech longer than LONG_FORM_SECONDS is split at pauses into
+# overlapping chunks that are decoded together (0 = off)
+LONG_FORM_SECONDS = float(os.environ.get('LONG_FORM_SECONDS', '60'))
+CHUNK_SECONDS = float(os.environ.get('CHUNK_SECONDS', '25'))
+CHUNK_OVERLAP = float(os.environ.get('CHUNK_OVERLAP', '1'))
+# CPU only: decode chunks in this many processes, each with its own model copy
+# and a share of the cores (0 = batch them on the already loaded model)
+LONG_FORM_WORKERS = int(os.environ.get('LONG_FORM_WORKERS', '0'))
+
+# Transcription job queue: when this many jobs are waiting, the oldest is dropped
+TRANSCRIPTION_QUEUE_SIZE = int(os.environ.get('TRANSCRIPTION_QUEUE_SIZE', '4'))
+
+# Keep each recording, FLAC-compressed, in an append-only archive in AUDIO_DIR
+# (written off the paste path); oldest audio is evicted past these limits
+SAVE_AUDIO = os.environ.get('SAVE_AUDIO', '0') == '1'
+AUDIO_MAX_MB = float(os.environ.get('AUDIO_MAX_MB', '1024'))
+AUDIO_MAX_DAYS = float(os.environ.get('AUDIO_MAX_DAYS', '30'))
+
 # Global state
 recording = False
-audio_queue = queue.Queue()
-frames = []
+capture = None  # AudioBuffer for the current recording (16 kHz int16)
+resampler = None  # PolyphaseResampler from the device rate, None when it is already 16 kHz
+armed_stream = None  # always-open sd.InputStream in armed capture mode
+armed_rate = None
+preroll = None  # PrerollRing at the device rate, fed while not recording
+capture_open = False  # armed mode: the callback writes to capture rather than the pre-roll
+capture_lock = threading.Lock()
+block_arrived = threading.Event()
+armed_stats = {'callbacks': 0, 'seconds': 0.0, 'since': time.monotonic()}
 stream = None
-record_thread = None
 popup_window = None
 popup_label = None
 popup_queue = queue.Queue()  # Queue for popup commands
+POPUP_EVENT = '<<PopupCommand>>'  # wakes the GUI thread when a command is posted
+gui_root = None
 gui_thread = None
+stream_session = None
+db_writer = None  # storage.DatabaseWriter, started by setup_database()
+audio_archive = None  # AudioArchive, started by setup_audio_archive() when SAVE_AUDIO is on
+refiner = None  # Refiner, started by setup_refiner() when CASCADE is on
+summarizer = None  # Summarizer, started by setup_summarizer() when SUMMARIZE is on
 
-# Load whisper model
+# Transcription engine, owned by the transcription worker thread
 MODEL_NAME = os.environ.get('WHISPER_MODEL', 'small')
-print(f"Loading Whisper model: {MODEL_NAME} (this may take a while)")
-model = whisper.load_model(MODEL_NAME, device=DEVICE)
-print(f"✅ Whisper loaded on {DEVICE}")
+ENGINE_NAME = os.environ.get('TRANSCRIPTION_ENGINE', 'whisper')  # 'whisper', 'faster-whisper', 'onnx' or 'daemon'
+
+# Decoding profile: 'fast', 'balanced' or 'accurate' (engines.DECODING_PROFILES),
+# also switchable from the tray. WHISPER_LANGUAGE pins the language (e.g. 'en',
+# 'pt') so no utterance pays for detection; otherwise fast reuses the first
+# language detected on at least LANGUAGE_CACHE_SECONDS of speech this session
+# (the other profiles detect it every time)
+DECODING_PROFILE = os.environ.get('DECODING_PROFILE', 'balanced')
+WHISPER_LANGUAGE = os.environ.get('WHISPER_LANGUAGE', '')
+LANGUAGE_CACHE_SECONDS = float(os.environ.get('LANGUAGE_CACHE_SECONDS', '3'))
+
+# CPU performance mode
+CPU_QUANTIZE = os.environ.get('CPU_QUANTIZE', '0') == '1'     # dynamic int8 for linear layers (whisper engine)
+CPU_THREADS = int(os.environ.get('CPU_THREADS', '0'))           # intra-op threads, 0 = runtime default
+CPU_AFFINITY = os.environ.get('CPU_AFFINITY', '')               # cores to pin to, e.g. '0-3' or '0,2,4'
+CPU_QUANTIZE_COMPARE = os.environ.get('CPU_QUANTIZE_COMPARE', '')  # audio file to compare int8 vs float32 on
+
+# Cascade mode: paste the draft from WHISPER_MODEL right away, then re-transcribe
+# it with REFINE_MODEL once the machine has been idle for a while
+CASCADE = os.environ.get('CASCADE', '0') == '1'
+REFINE_MODEL = os.environ.get('REFINE_MODEL', 'small')
+REFINE_IDLE_SECONDS = float(os.environ.get('REFINE_IDLE_SECONDS', '30'))
+REFINE_MAX_CPU = float(os.environ.get('REFINE_MAX_CPU', '50'))  # system CPU % above which refinement waits
+REFINE_BACKLOG = int(os.environ.get('REFINE_BACKLOG', '20'))     # drafts held in memory
+
+# Residency: 'hot' keeps the model loaded; 'unload' frees it after MODEL_IDLE_MINUTES
+# without dictation; 'downgrade' swaps in the small IDLE_MODEL instead. Either
+# way the full model starts reloading as soon as the hotkey goes down
+MODEL_RESIDENCY = os.environ.get('MODEL_RESIDENCY', 'hot')
+MODEL_IDLE_MINUTES = float(os.environ.get('MODEL_IDLE_MINUTES', '15'))
+IDLE_MODEL = os.environ.get('IDLE_MODEL', 'tiny')
+
+# Summaries: fill the summary column in the background with a local Ollama
+# model (extractive first sentences when it is unreachable). Transcriptions
+# shorter than SUMMARY_MIN_CHARS always get the extractive one
+SUMMARIZE = os.environ.get('SUMMARIZE', '0') == '1'
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'llama3.2')
+OLLAMA_TIMEOUT = float(os.environ.get('OLLAMA_TIMEOUT', '60'))
+SUMMARY_MIN_CHARS = int(os.environ.get('SUMMARY_MIN_CHARS', '280'))
+
+DEVICE = None
+model = None  # TranscriptionEngine
+chunk_workers = None  # ChunkWorkers, when long-form chunks are decoded in separate processes
+model_ready = threading.Event()  # set while some model can transcribe
+full_model_ready = threading.Event()  # set while MODEL_NAME itself is loaded
+residency = {'state': 'loading', 'last_used': time.monotonic(), 'reloading': False, 'reloads': [],
+             'evictions': 0, 'error': None}
+residency_lock = threading.Lock()
+# Current profile, the language cached for it, the last measured detection
+# time and per-profile decode totals (for comparing what each one costs)
+decoding = {'profile': DECODING_PROFILE, 'language': None, 'detection_seconds': None, 'stats': {}}
+
+
+class JobQueue:
+    """Bounded FIFO feeding the transcription worker.
+
+    Jobs are dicts like popup commands ({'kind': 'recording', ...}). When the
+    queue is full, the oldest waiting job is superseded to make room, so a
+    backlog can't hold up the newest dictation indefinitely. Interim
+    stream passes go first and never displace a recording: with only
+    recordings waiting, a new stream pass is the one turned away.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.jobs = deque()
+        self.cond = threading.Condition()
+        self.woken = False
+
+    def __len__(self) -> int:
+        return len(self.jobs)
+
+    def put(self, job: dict) -> dict:
+        """Add a job; return the job it superseded (possibly job itself), if any"""
+        superseded = None
+        with self.cond:
+            if len(self.jobs) >= self.maxsize:
+                superseded = next((j for j in self.jobs if j['kind'] == 'stream_pass'), None)
+                if superseded is not None:
+                    self.jobs.remove(superseded)
+                elif job['kind'] == 'stream_pass':
+                    return job
+                else:
+                    superseded = self.jobs.popleft()
+            self.jobs.append(job)
+            self.cond.notify()
+        return superseded
+
+    def get(self, timeout: float = None) -> dict:
+        """Block until a job is available; return None on timeout or wake()"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.jobs or self.woken, timeout) or not self.jobs:
+                self.woken = False
+                return None
+            return self.jobs.popleft()
+
+    def wake(self):
+        """Make a blocked get() return None, so the worker recomputes its idle timeout"""
+        with self.cond:
+            self.woken = True
+            self.cond.notify()
+
+
+job_queue = JobQueue(TRANSCRIPTION_QUEUE_SIZE)
+
+
+def submit_job(job: dict):
+    """Queue a job for the transcription worker, reporting anything it displaced"""
+    job['queued_at'] = time.perf_counter()
+    superseded = job_queue.put(job)
+    if superseded is None:
+        return
+    if superseded['kind'] == 'stream_pass':
+        superseded['session'].in_flight = False
+    else:
+        print(f"⚠️ Transcription queue full, dropped a stale {superseded['duration']:.1f}s recording")
+
+
+def load_model():
+    """Import and load the configured transcription engine"""
+    global model, DEVICE, chunk_workers
+    try:
+        start = time.perf_counter()
+        print(f"Loading {ENGINE_NAME} model: {MODEL_NAME} (this may take a while)")
+        # The int8 vs float32 comparison is a startup report; reloads after an eviction skip it
+        first_load = residency['evictions'] == 0
+        engine = create_engine(ENGINE_NAME, MODEL_NAME, quantize=CPU_QUANTIZE, threads=CPU_THREADS,
+                               affinity=CPU_AFFINITY, compare_audio=CPU_QUANTIZE_COMPARE if first_load else '')
+        downgraded = model is not None
+        model = engine
+        DEVICE = model.device
+        residency['state'] = 'hot'
+        residency['error'] = None
+        full_model_ready.set()
+        model_ready.set()
+        if downgraded:
+            free_model_memory()  # the idle model is no longer referenced
+        print(f"✅ {ENGINE_NAME} loaded on {DEVICE} in {time.perf_counter() - start:.1f}s")
+        # A reload can finish while the worker waits with no deadline; re-arm eviction
+        job_queue.wake()
+        # On a GPU (or a daemon) one batched call already uses the whole device
+        if LONG_FORM_WORKERS > 1 and DEVICE == 'cpu' and ENGINE_NAME != 'daemon':
+            chunk_workers = ChunkWorkers(LONG_FORM_WORKERS, ENGINE_NAME, MODEL_NAME, CPU_QUANTIZE)
+            chunk_workers.start()  # load the copies now, not on the first long recording
+    except Exception as e:
+        residency['error'] = str(e)
+        print(f"Error loading transcription engine: {e}")
+
+
+def free_model_memory():
+    """Hand back the memory of models no longer referenced (including cached GPU memory)"""
+    gc.collect()
+    torch = sys.modules.get('torch')
+    if torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def ensure_model():
+    """Start reloading the full model if it was evicted (called when the hotkey goes down).
+
+    The reload runs on its own thread, so it overlaps with the user speaking.
+    """
+    with residency_lock:
+        # While evicting, the worker calls this again once it is done; after a
+        # failed load the worker's own retry loop is the only one that reloads
+        if full_model_ready.is_set() or residency['reloading'] or residency['state'] in ('loading', 'evicting', 'failed'):
+            return
+        residency['reloading'] = True
+    
+    def reload():
+        start = time.perf_counter()
+        print(f"🔁 Reloading {MODEL_NAME} ({residency['state']})...")
+        try:
+            load_model()
+        finally:
+            with residency_lock:
+                residency['reloading'] = False
+        if full_model_ready.is_set():
+            residency['reloads'].append(time.perf_counter() - start)
+    
+    threading.Thread(target=reload, daemon=True).start()
+
+
+def evict_model():
+    """Apply the idle policy to the full model (runs on the worker, between jobs)"""
+    global model, chunk_workers
+    with residency_lock:
+        if residency['reloading'] or not full_model_ready.is_set():
+            return
+        full_model_ready.clear()
+        residency['state'] = 'evicting'
+    
+    idle = None
+    if MODEL_RESIDENCY == 'downgrade':
+        try:
+            idle = create_engine(ENGINE_NAME, IDLE_MODEL, quantize=CPU_QUANTIZE, threads=CPU_THREADS)
+        except Exception as e:
+            print(f"Error loading idle model {IDLE_MODEL}: {e}")
+    if idle is None:
+        model_ready.clear()
+    model = idle
+    if chunk_workers is not None:
+        chunk_workers.close()
+        chunk_workers = None
+    free_model_memory()
+    residency['state'] = 'downgraded' if idle is not None else 'unloaded'
+    residency['evictions'] += 1
+    print(f"💤 Idle for {MODEL_IDLE_MINUTES:.0f} min: {MODEL_NAME} "
+          f"{'replaced by ' + IDLE_MODEL if idle is not None else 'unloaded'}")
+
+
+def residency_status() -> str:
+    """One-line summary of what is loaded and what reloads have cost"""
+    if residency['state'] == 'hot':
+        status = f"{MODEL_NAME} loaded"
+    elif residency['state'] == 'downgraded':
+        status = f"{IDLE_MODEL} (idle), {MODEL_NAME} unloaded"
+    else:
+        status = f"{MODEL_NAME} {residency['state']}"
+    reloads = residency['reloads']
+    if reloads:
+        status += f", {len(reloads)} reloads avg {sum(reloads) / len(reloads):.1f}s"
+    return status
+
+
+def idle_timeout(warm_in: float = None) -> float:
+    """How long the worker may block before it has idle work to do (None = forever).
+
+    warm_in is the time left until the next idle warm-up, if any. The
+    residency deadline doesn't apply to the daemon engine, which never evicts.
+    """
+    timeouts = [warm_in] if warm_in is not None else []
+    if MODEL_RESIDENCY != 'hot' and ENGINE_NAME != 'daemon' and full_model_ready.is_set():
+        timeouts.append(max(residency['last_used'] + MODEL_IDLE_MINUTES * 60 - time.monotonic(), 0))
+    return min(timeouts) if timeouts else None
+
+
+def transcription_worker_func():
+    """Own the model: load it, then run queued jobs one at a time, in order.
+
+    Recordings made while the model loads simply wait in the queue. Being the
+    only thread that touches the model, the worker also runs the warm-ups.
+    """
+    load_model()
+    # A failed download, missing runtime or daemon that isn't up yet may be
+    # fixed without restarting the app; recordings wait in the queue meanwhile
+    backoff = 5
+    while model is None:
+        residency['state'] = 'failed'
+        print(f"⚠️ Retrying model load in {backoff}s")
+        time.sleep(backoff)
+        backoff = min(backoff * 2, 300)
+        residency['state'] = 'loading'
+        load_model()
+    residency['last_used'] = time.monotonic()
+    if MODEL_RESIDENCY != 'hot' and ENGINE_NAME == 'daemon':
+        print("⚠️ MODEL_RESIDENCY has no effect with the daemon engine; the daemon owns the model")
+
+    warmed = not WARMUP
+    warm_timeout = WARMUP_IDLE_MINUTES * 60 if WARMUP and WARMUP_IDLE_MINUTES > 0 else None
+    last_warm = time.monotonic()
+    while True:
+        if not warmed and len(job_queue) == 0:
+            warm_up_model()
+            warmed = True
+            last_warm = time.monotonic()
+        # Re-warm after warm_timeout without jobs or warm-ups (only while the full model is loaded)
+        warm_in = None
+        if warm_timeout is not None and full_model_ready.is_set():
+            warm_in = max(max(residency['last_used'], last_warm) + warm_timeout - time.monotonic(), 0)
+        job = job_queue.get(timeout=idle_timeout(warm_in))
+        if job is None:
+            warm_due = (warm_in is not None and full_model_ready.is_set()
+                        and time.monotonic() >= max(residency['last_used'], last_warm) + warm_timeout)
+            if idle_timeout() == 0:
+                evict_model()
+            elif warm_due:
+                warm_up_model("Idle warm-up")
+                last_warm = time.monotonic()
+            continue
+        try:
+            if job['kind'] == 'stream_pass':
+                job['session'].advance(job['audio'])
+            else:
+                waited = time.perf_counter() - job['queued_at']
+                print(f"🔄 Transcribing (waited {waited * 1000:.0f} ms, {len(job_queue)} still queued)...")
+                show_popup("Transcribing...", animate=True)
+                job['trace']['queue_wait'] = waited
+                wait_for_model(job['trace'])
+                run_transcription(job['audio'], job['duration'], job['audio_file'], job['session'], job['trace'])
+        except Exception as e:
+            print(f"Transcription worker error: {e}")
+        residency['last_used'] = time.monotonic()
+
+
+def wait_for_model(trace: dict):
+    """Block until a model can take the recording, timing any wait for a reload.
+
+    With 'downgrade' the idle model is used if the full one isn't back yet.
+    """
+    if model_ready.is_set():
+        return
+    start = time.perf_counter()
+    ensure_model()  # normally already started when the hotkey went down
+    while not model_ready.wait(5):
+        ensure_model()  # retry if the reload failed
+    trace['model_load'] = time.perf_counter() - start
+    print(f"⏳ Waited {trace['model_load']:.1f}s for the model to reload")
+
+
+def warm_up_model(label: str = "Warm-up"):
+    """Run dummy audio of typical lengths through the model and report latency.
+
+    Each length is transcribed twice: the first call pays for CUDA/cuDNN init,
+    allocator growth and kernel selection, the second shows steady state.
+    """
+    rng = np.random.default_rng(0)
+    for seconds in WARMUP_LENGTHS:
+        # Low-level noise rather than zeros, so the decoder runs too
+        dummy = (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 0.01).astype(np.float32)
+        timings = []
+        for _ in range(2):
+            start = time.perf_counter()
+            model.transcribe(dummy, **decode_options())
+            timings.append(time.perf_counter() - start)
+        print(f"🔥 {label} {seconds:.0f}s clip: cold {timings[0] * 1000:.0f} ms, warm {timings[1] * 1000:.0f} ms")
 
 
 def setup_directories():
@@ -71,122 +467,281 @@ def setup_directories():
 
 
 def setup_database():
-    """Initialize SQLite database for storing transcriptions and summaries"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS transcriptions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT NOT NULL,
-            audio_file TEXT,
-            transcription TEXT NOT NULL,
-            summary TEXT,
-            duration REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    """Initialize the database and start the background writer"""
+    global db_writer
+    storage.setup_database(DB_PATH)
+    db_writer = storage.DatabaseWriter(DB_PATH)
+    db_writer.start()
+
+
+def setup_audio_archive():
+    """Start the audio archive if recordings are being kept"""
+    global audio_archive
+    if not SAVE_AUDIO:
+        return
+    
+    def on_evict(segment_name: str):
+        # The rows stay; only their audio is gone
+        db_writer.execute('UPDATE transcriptions SET audio_file = NULL WHERE audio_file LIKE ?',
+                          (f'{segment_name}:%',))
+    
+    audio_archive = AudioArchive(AUDIO_DIR, SAMPLE_RATE, max_bytes=int(AUDIO_MAX_MB * 2**20),
+                                 max_age_days=AUDIO_MAX_DAYS, on_evict=on_evict)
+    audio_archive.start()
+
+
+def archive_audio(audio: np.ndarray, row_future):
+    """Archive a recording and link it to its transcriptions row once both are stored"""
+    def on_stored(locator: str):
+        row_id = row_future.result(timeout=30)
+        db_writer.execute('UPDATE transcriptions SET audio_file = ? WHERE id = ?', (locator, row_id))
+    
+    audio_archive.append_async(audio, on_stored)
+
+
+def setup_refiner():
+    """Start the background refiner if cascade mode is on"""
+    global refiner
+    if not CASCADE:
+        return
+    
+    def load_refine_engine():
+        start = time.perf_counter()
+        print(f"Loading refinement model: {REFINE_MODEL}")
+        engine = create_engine(ENGINE_NAME, REFINE_MODEL, quantize=CPU_QUANTIZE, threads=CPU_THREADS)
+        print(f"✅ Refinement model loaded in {time.perf_counter() - start:.1f}s")
+        return engine
+    
+    def read_archived(locator: str):
+        audio = audio_archive.read(locator) if audio_archive is not None else None
+        return apply_vad(audio) if audio is not None else None
+    
+    refiner = Refiner(load_refine_engine, on_refined, is_busy=machine_busy, read_audio=read_archived,
+                      idle_seconds=REFINE_IDLE_SECONDS, max_pending=REFINE_BACKLOG)
+    # Drafts left over from the last session can still be refined from the archive
+    if audio_archive is not None:
+        for row_id, locator in reversed(storage.pending_drafts(DB_PATH, REFINE_BACKLOG)):
+            refiner.submit(row_id, locator)
+    refiner.start()
+
+
+def setup_summarizer():
+    """Start the background summarizer if enabled; it begins with any backlog"""
+    global summarizer
+    if not SUMMARIZE:
+        return
+    # Imported here so requests costs nothing at startup when summaries are off
+    from summarizer import OllamaClient, Summarizer
+
+    client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, OLLAMA_TIMEOUT)
+    summarizer = Summarizer(DB_PATH, db_writer, client, min_chars=SUMMARY_MIN_CHARS, is_busy=machine_busy)
+    summarizer.start()
+    summarizer.submit()
+
+
+def machine_busy() -> bool:
+    """True while dictating, transcribing, or when other programs are using the CPU"""
+    if recording or len(job_queue) > 0:
+        return True
+    try:
+        import psutil
+        return psutil.cpu_percent(interval=None) > REFINE_MAX_CPU
+    except ImportError:
+        return False
+
+
+def on_refined(row_id: int, text: str, seconds: float):
+    """Replace a draft with the refined text, keeping the draft alongside it"""
+    if text:
+        # The summary was of the draft (if any); clearing it queues a new one
+        update = db_writer.execute('''
+            UPDATE transcriptions SET draft_transcription = transcription, transcription = ?, status = 'final',
+                summary = NULL, summary_model = NULL
+            WHERE id = ?
+        ''', (text, row_id))
+    else:
+        update = db_writer.execute("UPDATE transcriptions SET status = 'final' WHERE id = ?", (row_id,))
+    if summarizer is not None:
+        update.add_done_callback(summarizer.submit)
+    print(f"🪄 Refined #{row_id} with {REFINE_MODEL} in {seconds:.1f}s ({len(refiner)} drafts left)")
 
 
 def gui_thread_func():
-    """Dedicated GUI thread that runs tkinter mainloop"""
-    global popup_window, popup_label
+    """Dedicated GUI thread that runs tkinter mainloop.
+
+    Nothing polls: other threads post commands to popup_queue and wake the
+    loop with a virtual event, so an idle app causes no GUI wakeups.
+    """
+    global gui_root
     
     root = tk.Tk()
     root.withdraw()  # Hide the root window
+    animation = {'job': None, 'step': 0, 'message': ''}
+    
+    def animate():
+        """Cycle the dots under an animated message while the popup is up"""
+        dots = ["●", "●●", "●●●"]
+        if popup_label is not None:
+            popup_label.config(text=f"{animation['message']}\n{dots[animation['step'] % 3]}")
+            animation['step'] += 1
+            animation['job'] = root.after(300, animate)
+    
+    def stop_animation():
+        if animation['job'] is not None:
+            root.after_cancel(animation['job'])
+            animation['job'] = None
     
-    def check_queue():
-        """Check for popup commands from other threads"""
+    def handle_commands(event=None):
+        """Apply popup commands posted by other threads"""
         global popup_window, popup_label
         
-        try:
-            while not popup_queue.empty():
+        while True:
+            try:
                 command = popup_queue.get_nowait()
+            except queue.Empty:
+                return
+            
+            if command['action'] == 'show':
+                stop_animation()
+                # Close existing popup if any
+                if popup_window is not None:
+                    try:
+                        popup_window.destroy()
+                    except:
+                        pass
                 
-                if command['action'] == 'show':
-                    # Close existing popup if any
-                    if popup_window is not None:
-                        try:
-                            popup_window.destroy()
-                        except:
-                            pass
-                    
-                    # Create new popup
-                    popup_window = tk.Toplevel(root)
-                    popup_window.geometry("250x120")
-                    popup_window.config(bg="#2b2b2b")
-                    popup_window.attributes('-topmost', True)
-                    popup_window.resizable(False, False)
-                    popup_window.overrideredirect(True)
-                    
-                    # Center on screen
-                    popup_window.update_idletasks()
-                    x = (popup_window.winfo_screenwidth() // 2) - (250 // 2)
-                    y = (popup_window.winfo_screenheight() // 2) - (120 // 2)
-                    popup_window.geometry(f"250x120+{x}+{y}")
-                    
-                    # Add label
-                    font_style = font.Font(family="Arial", size=16, weight="bold")
-                    popup_label = tk.Label(popup_window, text=command['message'], 
-                                          fg="#4da6ff", bg="#2b2b2b", font=font_style)
-                    popup_label.pack(expand=True)
-                    
-                elif command['action'] == 'hide':
-                    if popup_window is not None:
-                        try:
-                            popup_window.destroy()
-                            popup_window = None
-                            popup_label = None
-                        except:
-                            pass
+                # Create new popup
+                popup_window = tk.Toplevel(root)
+                popup_window.geometry("250x120")
+                popup_window.config(bg="#2b2b2b")
+                popup_window.attributes('-topmost', True)
+                popup_window.resizable(False, False)
+                popup_window.overrideredirect(True)
                 
-                elif command['action'] == 'update':
-                    if popup_label is not None:
-                        try:
-                            popup_label.config(text=command['message'])
-                        except:
-                            pass
-        
-        except queue.Empty:
-            pass
-        
-        # Schedule next check
-        root.after(50, check_queue)
+                # Center on screen
+                popup_window.update_idletasks()
+                x = (popup_window.winfo_screenwidth() // 2) - (250 // 2)
+                y = (popup_window.winfo_screenheight() // 2) - (120 // 2)
+                popup_window.geometry(f"250x120+{x}+{y}")
+                
+                # Add label
+                font_style = font.Font(family="Arial", size=16, weight="bold")
+                popup_label = tk.Label(popup_window, text=command['message'], 
+                                      fg="#4da6ff", bg="#2b2b2b", font=font_style)
+                popup_label.pack(expand=True)
+                if command.get('animate'):
+                    animation.update(step=0, message=command['message'])
+                    animate()
+                
+            elif command['action'] == 'hide':
+                stop_animation()
+                if popup_window is not None:
+                    try:
+                        popup_window.destroy()
+                        popup_window = None
+                        popup_label = None
+                    except:
+                        pass
+            
+            elif command['action'] == 'update':
+                stop_animation()
+                if popup_label is not None:
+                    try:
+                        popup_label.config(text=command['message'])
+                    except:
+                        pass
+            
+            elif command['action'] == 'search':
+                open_search_window(root)
     
-    # Start checking queue
-    check_queue()
+    root.bind(POPUP_EVENT, handle_commands)
+    gui_root = root
+    # Commands posted before the loop was running couldn't wake it
+    root.after_idle(handle_commands)
     
     # Run tkinter mainloop
     root.mainloop()
 
 
-def show_popup(message: str):
-    """Show popup window with message (thread-safe)"""
-    popup_queue.put({'action': 'show', 'message': message})
+def post_popup_command(command: dict):
+    """Queue a command for the GUI thread and wake it (thread-safe)"""
+    popup_queue.put(command)
+    if gui_root is None:
+        return
+    try:
+        gui_root.event_generate(POPUP_EVENT, when='tail')
+    except (RuntimeError, tk.TclError):
+        pass  # GUI not in its main loop yet; its startup drain picks the command up
+
+
+# Snippet markers for search highlights; control characters never occur in transcriptions
+HIGHLIGHT_START = '\x02'
+HIGHLIGHT_END = '\x03'
+
+
+def open_search_window(root: tk.Tk):
+    """Search box over the transcription history (runs on the GUI thread)"""
+    window = tk.Toplevel(root)
+    window.title("Voice2Text - Search")
+    window.geometry("600x450")
+    window.attributes('-topmost', True)
+    
+    entry = tk.Entry(window, font=("Arial", 12))
+    entry.pack(fill='x', padx=8, pady=8)
+    results = tk.Text(window, wrap='word', font=("Arial", 10))
+    results.pack(fill='both', expand=True, padx=8, pady=(0, 8))
+    results.tag_config('match', background="#ffe680")
+    results.tag_config('date', foreground="#666666")
+    
+    def run_search(event=None):
+        start = time.perf_counter()
+        matches = storage.search_transcriptions(DB_PATH, entry.get(), highlight=(HIGHLIGHT_START, HIGHLIGHT_END))
+        elapsed = (time.perf_counter() - start) * 1000
+        results.config(state='normal')
+        results.delete('1.0', 'end')
+        results.insert('end', f"{len(matches)} matches in {elapsed:.0f} ms\n\n", 'date')
+        for match in matches:
+            results.insert('end', f"📅 {match['timestamp']}\n", 'date')
+            # Split on the markers: odd-numbered pieces are the matched words
+            pieces = match['snippet'].replace(HIGHLIGHT_END, HIGHLIGHT_START).split(HIGHLIGHT_START)
+            for i, piece in enumerate(pieces):
+                results.insert('end', piece, 'match' if i % 2 else ())
+            results.insert('end', "\n\n")
+        results.config(state='disabled')
+    
+    entry.bind('<Return>', run_search)
+    entry.focus_set()
+
+
+def search_history(icon=None, item=None):
+    """Open the history search window (thread-safe)"""
+    post_popup_command({'action': 'search'})
+
+
+def format_search_results(query: str, limit: int = 20) -> str:
+    """Search history and render ranked matches with highlighted words"""
+    start = time.perf_counter()
+    matches = storage.search_transcriptions(DB_PATH, query, limit)
+    output = f"{len(matches)} matches for '{query}' ({(time.perf_counter() - start) * 1000:.0f} ms):\n\n"
+    for match in matches:
+        output += f"📅 {match['timestamp']}\n"
+        output += f"📝 {match['snippet']}\n\n"
+    return output
+
+
+def show_popup(message: str, animate: bool = False):
+    """Show popup window with message, optionally with animated dots (thread-safe)"""
+    post_popup_command({'action': 'show', 'message': message, 'animate': animate})
 
 
 def hide_popup():
     """Hide popup window (thread-safe)"""
-    popup_queue.put({'action': 'hide'})
+    post_popup_command({'action': 'hide'})
 
 
 def update_popup(message: str):
     """Update popup message (thread-safe)"""
-    popup_queue.put({'action': 'update', 'message': message})
-
-
-def animate_popup_thread():
-    """Animate popup with dots in background thread"""
-    dots = ["●", "●●", "●●●"]
-    for dot in dots * 3:
-        try:
-            update_popup(f"Transcribing...\n{dot}")
-            time.sleep(0.3)
-        except:
-            break
+    post_popup_command({'action': 'update', 'message': message})
 
 
 def make_icon() -> Image.Image:
@@ -207,219 +762,454 @@ def make_icon() -> Image.Image:
 def audio_callback(indata, frames_count, time_info, status):
     if status:
         print(f"Sounddevice status: {status}")
-    # copy data to queue as bytes
-    audio_queue.put(indata.copy())
-
+    block = indata[:, 0]
+    if armed_stream is None:
+        record_block(block)
+        return
+    start = time.perf_counter()
+    with capture_lock:
+        if capture_open:
+            record_block(block)
+        else:
+            preroll.write(block)
+    block_arrived.set()
+    armed_stats['callbacks'] += 1
+    armed_stats['seconds'] += time.perf_counter() - start
+
+
+def record_block(block: np.ndarray):
+    """Resample a block of device audio into the current recording"""
+    if resampler is not None:
+        block = resampler.process(block)
+    # write straight into the preallocated capture buffer
+    capture.write(block)
+    if stream_session is not None:
+        # Cheap length check; queues an interim pass once a full window is in
+        stream_session.maybe_advance(capture)
+
+
+class StreamingSession:
+    """Transcribes a recording incrementally while it is still being captured.
+
+    Completed windows are queued as interim passes for the transcription
+    worker. Every segment except the last one is committed (the last may be
+    cut mid-word), so on release only the audio after the last committed
+    segment needs decoding.
+    """
 
-def record_thread_func(stream):
-    global recording, frames
-    frames = []
-    while recording:
+    def __init__(self):
+        self.committed_text = []
+        self.committed_samples = 0
+        self.in_flight = False
+        self.finished = False
+        self.lock = threading.Lock()
+
+    def maybe_advance(self, buffer: AudioBuffer):
+        """Queue an interim pass if a full window is pending and none is queued.
+
+        Called from the audio callback, so it must never block for long.
+        """
+        if self.in_flight or len(buffer) - self.committed_samples < STREAM_WINDOW * SAMPLE_RATE:
+            return
+        if not model_ready.is_set():
+            return
+        with self.lock:
+            if self.finished or self.in_flight:
+                return
+            self.in_flight = True
+        submit_job({'kind': 'stream_pass', 'session': self, 'audio': buffer.view()})
+
+    def _prompt(self) -> str:
+        # Feed the tail of the committed text back in to keep the wording consistent
+        return ' '.join(self.committed_text)[-200:] or None
+
+    def advance(self, audio: np.ndarray):
+        """Run an interim pass (on the worker) and commit its stable segments"""
         try:
-            chunk = audio_queue.get(timeout=0.5)
-            frames.append(chunk)
-        except queue.Empty:
-            continue
+            if self.finished:
+                return
+            audio = to_float32(audio[self.committed_samples:])
+            result = model.transcribe(audio, initial_prompt=self._prompt(), **decode_options())
+            remember_language(result, len(audio) / SAMPLE_RATE)
+            stable = result.get('segments', [])[:-1]
+            if not stable:
+                return
+            self.committed_text.extend(seg['text'].strip() for seg in stable if seg['text'].strip())
+            self.committed_samples += int(stable[-1]['end'] * SAMPLE_RATE)
+            print(f"📝 Committed {self.committed_samples / SAMPLE_RATE:.1f}s of audio")
+        except Exception as e:
+            print(f"Streaming pass error: {e}")
+        finally:
+            self.in_flight = False
+
+    def finish(self, audio: np.ndarray) -> str:
+        """Decode the uncommitted tail and return the full text.
+
+        Runs on the worker, so any interim pass queued earlier has completed.
+        """
+        with self.lock:
+            self.finished = True
+        tail = apply_vad(audio[self.committed_samples:])
+        parts = list(self.committed_text)
+        if len(tail) > 0:
+            result = model.transcribe(tail, initial_prompt=self._prompt(), **decode_options())
+            remember_language(result, len(tail) / SAMPLE_RATE)
+            parts.append(result.get('text', '').strip())
+        return ' '.join(p for p in parts if p)
+
+
+def input_sample_rate() -> int:
+    """CAPTURE_RATE, or the default input device's native rate"""
+    if CAPTURE_RATE > 0:
+        return CAPTURE_RATE
+    try:
+        return int(sd.query_devices(kind='input')['default_samplerate'])
+    except Exception as e:
+        print(f"Could not query the input device ({e}), capturing at {SAMPLE_RATE} Hz")
+        return SAMPLE_RATE
+
+
+def open_armed_stream():
+    """Open the always-on input stream that keeps the pre-roll filled"""
+    global armed_stream, armed_rate, preroll
+    armed_rate = input_sample_rate()
+    preroll = PrerollRing(int(armed_rate * PREROLL_MS / 1000))
+    try:
+        stream = sd.InputStream(samplerate=armed_rate, channels=CHANNELS, dtype='int16',
+                                blocksize=int(armed_rate * ARMED_BLOCK_MS / 1000), callback=audio_callback)
+        armed_stream = stream
+        stream.start()
+    except Exception as e:
+        armed_stream = None
+        print(f"Could not keep the microphone open ({e}), opening it per recording instead")
+        return
+    armed_stats.update(callbacks=0, seconds=0.0, since=time.monotonic())
+    print(f"🎚️ Microphone armed at {armed_rate} Hz with {PREROLL_MS} ms pre-roll")
+
+
+def capture_budget_report() -> str:
+    """CPU and memory cost of armed capture, against ARMED_CPU_BUDGET"""
+    if armed_stream is None:
+        return "Armed capture is off (ARMED_CAPTURE=1 to enable)"
+    elapsed = max(time.monotonic() - armed_stats['since'], 1e-9)
+    cpu = armed_stats['seconds'] / elapsed * 100
+    report = (f"Armed capture: {armed_stats['callbacks'] / elapsed:.0f} callbacks/s, "
+              f"{cpu:.3f}% of one core in the callback (budget {ARMED_CPU_BUDGET:g}%), "
+              f"pre-roll {preroll.nbytes / 1024:.0f} KB")
+    if cpu > ARMED_CPU_BUDGET:
+        report += "\n⚠️ Over budget: raise ARMED_BLOCK_MS or turn ARMED_CAPTURE off"
+    return report
+
+
+def show_capture_budget(icon=None, item=None):
+    """Print the armed capture CPU/memory report"""
+    output = capture_budget_report()
+    print(output)
+    return output
 
 
 def start_recording():
-    global recording, stream, record_thread
+    global recording, stream, stream_session, capture, resampler, capture_open
     if recording:
         return
     recording = True
+    if refiner is not None:
+        refiner.touch()
+    ensure_model()
+    # Capture 16-bit at the device's own rate and resample block by block, so
+    # the host API never has to convert and the buffer holds 16 kHz int16
+    device_rate = armed_rate if armed_stream is not None else input_sample_rate()
+    resampler = PolyphaseResampler(device_rate, SAMPLE_RATE) if device_rate != SAMPLE_RATE else None
+    capture = AudioBuffer(SAMPLE_RATE, max_seconds=MAX_RECORDING_SECONDS, dtype=np.int16)
+    stream_session = StreamingSession() if STREAMING else None
+    if armed_stream is not None:
+        # The stream is already running: start from the pre-roll and switch
+        # the callback over, with no gap or overlap between the two
+        with capture_lock:
+            record_block(preroll.snapshot())
+            capture_open = True
     show_popup("🎙️ Listening...")
-    print("🎙️ Starting recording...")
-    stream = sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, callback=audio_callback)
-    stream.start()
-    record_thread = threading.Thread(target=record_thread_func, args=(stream,), daemon=True)
-    record_thread.start()
+    print(f"🎙️ Starting recording at {device_rate} Hz...")
+    if armed_stream is None:
+        stream = sd.InputStream(samplerate=device_rate, channels=CHANNELS, dtype='int16', callback=audio_callback)
+        stream.start()
 
 
 def stop_recording_and_transcribe():
-    global recording, stream, frames
+    global recording, stream, capture_open
     if not recording:
         return
     print("⏹️ Stopping recording...")
     recording = False
-    try:
-        stream.stop()
-        stream.close()
-    except Exception as e:
-        print(f"Error stopping stream: {e}")
-
-    # concatenate frames
-    if not frames:
+    # Per-stage timings, carried with the job and saved next to the transcription
+    trace = {'released_at': time.perf_counter()}
+    if armed_stream is not None:
+        # Wait for the block holding the moment of release, then switch the
+        # callback back to the pre-roll; the stream stays open
+        block_arrived.clear()
+        block_arrived.wait(ARMED_BLOCK_MS * 2 / 1000)
+        with capture_lock:
+            capture_open = False
+    else:
+        try:
+            stream.stop()
+            stream.close()
+        except Exception as e:
+            print(f"Error stopping stream: {e}")
+    trace['stream_stop'] = time.perf_counter() - trace['released_at']
+
+    # The stream is stopped, so only the resampler's last few samples are
+    # missing; a fresh buffer is allocated per recording, so nothing else
+    # writes to it during transcription
+    start = time.perf_counter()
+    if resampler is not None:
+        capture.write(resampler.flush(np.int16))
+    audio = to_float32(capture.view())
+    duration = capture.duration
+    trace['capture'] = time.perf_counter() - start
+    if capture.dropped:
+        print(f"⚠️ Recording exceeded {MAX_RECORDING_SECONDS:.0f}s, dropped {capture.dropped / SAMPLE_RATE:.1f}s")
+
+    if len(audio) == 0:
         print("⚠️ No audio captured. Skipping transcription.")
         return
 
-    audio_data = np.concatenate(frames, axis=0)
-    duration = len(audio_data) / SAMPLE_RATE
-    
-    # Verify we have valid audio data
-    if len(audio_data) == 0:
-        print("⚠️ No valid audio data. Skipping transcription.")
-        return
-    audio_data = (audio_data * 32767).astype(np.int16)
-
-    # Save to temp WAV
-    fd, path = tempfile.mkstemp(suffix='.wav')
-    os.close(fd)
-    with wave.open(path, 'wb') as wf:
-        wf.setnchannels(CHANNELS)
-        wf.setsampwidth(2)  # 16-bit
-        wf.setframerate(SAMPLE_RATE)
-        wf.writeframes(audio_data.tobytes())
+    audio_file = None  # set by the audio archive once the row is saved
 
-    print(f"Saved recording to {path}, launching transcription...")
+    print(f"Captured {duration:.1f}s of audio, launching transcription...")
 
     # Transcribe and paste - run in a new thread to avoid blocking main
-    t = threading.Thread(target=transcribe_and_paste, args=(path, duration), daemon=True)
+    t = threading.Thread(target=transcribe_and_paste, args=(audio, duration, audio_file, stream_session, trace),
+                         daemon=True)
     t.start()
 
 
-def check_ollama_available():
-    """Check if Ollama is running and accessible"""
-    try:
-        response = requests.get(f'{OLLAMA_URL}/api/tags', timeout=2)
-        return response.status_code == 200
-    except:
-        return False
+def apply_vad(audio: np.ndarray) -> np.ndarray:
+    """Trim silence using the configured VAD thresholds (empty result = no speech)"""
+    if not VAD_ENABLED:
+        return audio
+    return trim_silence(audio, SAMPLE_RATE, margin_db=VAD_MARGIN_DB, floor_db=VAD_FLOOR_DB,
+                        min_speech_ms=VAD_MIN_SPEECH_MS, pad_ms=VAD_PAD_MS, max_pause_ms=VAD_MAX_PAUSE_MS,
+                        speech_db=VAD_SPEECH_DB)
 
 
-def summarize_with_ollama(text: str) -> str:
-    """
-    Summarize text using Ollama (free, local LLM)
-    Falls back to extractive summary if Ollama unavailable
-    """
-    if not check_ollama_available():
-        print("⚠️ Ollama not running. Using simple summarization...")
-        return simple_summarize(text)
-    
+def save_to_database(transcription: str, duration: float, audio_file: str = None,
+                     speech_duration: float = None, trace: dict = None, status: str = None):
+    """Queue a transcription for the background writer; returns a Future for the row id"""
+    stage_timings = {stage: seconds for stage, seconds in (trace or {}).items() if stage != 'released_at'}
+    return db_writer.insert_transcription(transcription, duration, audio_file, speech_duration, stage_timings,
+                                          status)
+
+
+def stage_latency_report(last_n: int = 100) -> str:
+    """Summarize p50/p95 per stage (and real-time factor) over the last N utterances"""
     try:
-        prompt = f"""You will receive a raw voice-note transcription.
-Summarize it **without changing my tone, wording style, or way of speaking**.
+        conn = sqlite3.connect(DB_PATH)
+        rows = conn.execute('''
+            SELECT s.transcription_id, s.stage, s.seconds, t.duration
+            FROM stage_timings s JOIN transcriptions t ON t.id = s.transcription_id
+            WHERE s.transcription_id IN (
+                SELECT DISTINCT transcription_id FROM stage_timings
+                ORDER BY transcription_id DESC LIMIT ?
+            )
+        ''', (last_n,)).fetchall()
+        conn.close()
+    except Exception as e:
+        return f"Error reading stage timings: {e}"
+    
+    if not rows:
+        return "No stage timings recorded yet."
+    
+    by_stage = {}
+    model_time = {}
+    durations = {}
+    for transcription_id, stage, seconds, duration in rows:
+        by_stage.setdefault(stage, []).append(seconds)
+        if stage in ('language_detection', 'decode', 'transcribe'):
+            model_time[transcription_id] = model_time.get(transcription_id, 0.0) + seconds
+        durations[transcription_id] = duration
+    
+    output = f"Stage latency over last {len(durations)} utterances (p50 / p95 ms):\n\n"
+    for stage in TRACE_STAGES:
+        if stage in by_stage:
+            p50, p95 = np.percentile(by_stage[stage], [50, 95]) * 1000
+            output += f"  {stage:<20} {p50:8.0f} {p95:8.0f}\n"
+    rtf = [model_time[i] / durations[i] for i in model_time if durations.get(i)]
+    if rtf:
+        output += f"\nReal-time factor (model time / audio duration): p50 {np.percentile(rtf, 50):.2f}, "
+        output += f"p95 {np.percentile(rtf, 95):.2f}\n"
+    return output
 
-Rules:
-* Keep my natural, spoken style (including informal phrasing).
-* Do NOT make it sound formal, written, or "polished".
-* Remove repetitions, filler, and tangents (e.g. "like", "you know", circular explanations).
-* Keep the original intent, emphasis, and ordering of ideas.
-* Do not add conclusions, interpretations, or new framing.
 
-Output format:
-* Short, clean paragraphs or bullet points
-* Same voice as the original, just clearer and tighter
+def show_latency_stats(icon=None, item=None):
+    """Print per-stage latency percentiles"""
+    output = stage_latency_report()
+    print(output)
+    return output
 
-Transcription:
-{text}
 
-Cleaned up version:"""
-        
-        response = requests.post(
-            f'{OLLAMA_URL}/api/generate',
-            json={
-                'model': OLLAMA_MODEL,
-                'prompt': prompt,
-                'stream': False,
-                'temperature': 0.2,
-            },
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            result = response.json()
-            summary = result.get('response', '').strip()
-            return summary
-        else:
-            print(f"Ollama error: {response.status_code}")
-            return simple_summarize(text)
-    except Exception as e:
-        print(f"Error calling Ollama: {e}")
-        return simple_summarize(text)
+def decode_options() -> dict:
+    """transcribe() options for the current profile, with the pinned or cached language"""
+    profile = decoding['profile']
+    language = WHISPER_LANGUAGE or (decoding['language'] if DECODING_PROFILES[profile]['cache_language'] else None)
+    return decoding_options(profile, model.device, language)
 
 
-def simple_summarize(text: str) -> str:
-    """
-    Simple extractive summarization when LLM unavailable
-    Takes first 2-3 sentences as summary
+def remember_language(result: dict, speech_seconds: float):
+    """Cache the detected language for the rest of the session, if the profile allows it.
+
+    A guess from a word or two is easily wrong, so short clips are not cached.
     """
-    sentences = text.split('. ')
-    summary = '. '.join(sentences[:3])
-    if len(summary) > 200:
-        summary = summary[:200] + "..."
-    return summary
+    language = result.get('language')
+    if WHISPER_LANGUAGE or not language or decoding['language'] is not None:
+        return
+    if speech_seconds < LANGUAGE_CACHE_SECONDS:
+        return
+    if DECODING_PROFILES[decoding['profile']]['cache_language']:
+        decoding['language'] = language
+        print(f"🌐 Detected language '{language}'; reusing it for this session")
+
+
+def log_decode(result: dict, options: dict, speech_seconds: float, seconds: float):
+    """Print what the profile did for one utterance and how it compares with the others"""
+    profile = decoding['profile']
+    notes = []
+    detection = (result.get('timings') or {}).get('language_detection')
+    if detection is not None:
+        decoding['detection_seconds'] = detection
+        notes.append(f"language detected in {detection:.2f}s")
+    elif options.get('language'):
+        source = 'pinned' if WHISPER_LANGUAGE else 'cached'
+        saved = decoding['detection_seconds']
+        notes.append(f"language {source}" + (f", ~{saved:.2f}s detection skipped" if saved else ''))
+    fallbacks = sum(1 for segment in result.get('segments', []) if segment.get('temperature', 0) > 0)
+    if fallbacks:
+        notes.append(f"{fallbacks} segment(s) re-decoded at a higher temperature")
+
+    stats = decoding['stats'].setdefault(profile, {'utterances': 0, 'speech': 0.0, 'seconds': 0.0})
+    stats['utterances'] += 1
+    stats['speech'] += speech_seconds
+    stats['seconds'] += seconds
+    others = ', '.join(f"{name} {s['seconds'] / s['speech']:.2f}" for name, s in decoding['stats'].items()
+                       if name != profile and s['speech'] > 0)
+    rtf = stats['seconds'] / stats['speech'] if stats['speech'] > 0 else 0.0
+    print(f"🎛️ {profile}: {seconds:.2f}s for {speech_seconds:.1f}s of speech; mean RTF {rtf:.2f}"
+          + (f" (vs {others})" if others else '') + (f"; {'; '.join(notes)}" if notes else ''))
+
+
+def set_decoding_profile(name: str):
+    """Switch profile; the language is detected afresh under the new one"""
+    decoding['profile'] = name
+    decoding['language'] = None
+    print(f"🎛️ Decoding profile: {name}")
+
+
+def show_idle_wakeups(icon=None, item=None):
+    """Measure and print how often the app wakes the CPU (run while idle)"""
+    def measure():
+        rate = wakeup_rate(10)
+        if rate is None:
+            print("Wakeup counts are not available on this platform (pip install psutil)")
+        else:
+            print(f"💤 Idle wakeups: {rate:.1f}/s over 10s")
+    
+    threading.Thread(target=measure, daemon=True).start()
 
 
-def save_to_database(transcription: str, duration: float, audio_file: str = None):
-    """Save transcription to database"""
+def transcribe_and_paste(audio: np.ndarray, duration: float, audio_file: str = None,
+                         session: StreamingSession = None, trace: dict = None):
+    """Queue a recording for the transcription worker (pastes happen in order)"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        timestamp = datetime.now().isoformat()
-        
-        cursor.execute('''
-            INSERT INTO transcriptions (timestamp, audio_file, transcription, duration)
-            VALUES (?, ?, ?, ?)
-        ''', (timestamp, audio_file, transcription, duration))
-        
-        conn.commit()
-        conn.close()
-        print(f"✅ Saved to database")
+        submit_job({'kind': 'recording', 'audio': audio, 'duration': duration,
+                    'audio_file': audio_file, 'session': session, 'trace': trace or {}})
+        depth = len(job_queue)
+        if not model_ready.is_set() and residency['error'] is not None:
+            show_popup("⚠️ Model failed to load\nRetrying, recording queued")
+            threading.Timer(3, hide_popup).start()
+            print(f"⚠️ Model failed to load ({residency['error']}), queued recording ({depth} queued)")
+        elif not model_ready.is_set():
+            show_popup("⏳ Loading model...")
+            print(f"⏳ Model still loading, queued recording ({depth} queued)")
+        elif depth > 1:
+            show_popup(f"⏳ Queued\n{depth - 1} ahead")
+            print(f"⚠️ {depth} jobs queued - dictation is outpacing transcription")
     except Exception as e:
-        print(f"Error saving to database: {e}")
+        hide_popup()
+        print(f"Error: {e}")
 
 
-def transcribe_and_paste(wav_path: str, duration: float):
+def run_transcription(audio: np.ndarray, duration: float, audio_file: str = None,
+                      session: StreamingSession = None, trace: dict = None):
+    """Transcribe a recording, save it and paste the text (runs on the worker)"""
+    trace = trace if trace is not None else {}
     try:
-        show_popup("Transcribing...\n●")
-        print("🔄 Transcribing...")
-        
-        # Start animation in background
-        animation_thread = threading.Thread(target=animate_popup_thread, daemon=True)
-        animation_thread.start()
+        start = time.perf_counter()
+        speech = apply_vad(audio)
+        speech_duration = len(speech) / SAMPLE_RATE
+        trace['vad'] = time.perf_counter() - start
+        if len(speech) == 0:
+            hide_popup()
+            print("🔇 No speech detected. Skipping transcription.")
+            return
+        print(f"✂️ VAD kept {speech_duration:.1f}s of {duration:.1f}s")
         
-        # Run transcription in a thread
-        def transcribe_thread():
-            try:
-                result = model.transcribe(wav_path)
-                text = result.get('text', '').strip()
-                
-                print(f"✅ Transcription: {text[:100]}...")
-                
-                if text:
-                    # Save to database
-                    save_to_database(text, duration)
-                    
-                    # Copy transcription to clipboard
-                    pyperclip.copy(text)
-                    # Small delay to ensure clipboard is set
-                    time.sleep(0.05)
-                    # Send Ctrl+V to paste the transcription
-                    keyboard.send('ctrl+v')
-                    time.sleep(0.05)
-                    
-                    hide_popup()
-                    print("✨ Transcription pasted!")
-                else:
-                    hide_popup()
-                    print("⚠️ No text captured")
-            except Exception as e:
-                hide_popup()
-                print(f"Error during transcription: {e}")
-            finally:
-                # Delete temp file after transcription completes
-                try:
-                    os.remove(wav_path)
-                except Exception:
-                    pass
+        start = time.perf_counter()
+        if session is not None:
+            text = session.finish(audio)
+            trace['transcribe'] = time.perf_counter() - start
+        elif LONG_FORM_SECONDS > 0 and speech_duration > LONG_FORM_SECONDS:
+            batch = chunk_workers.transcribe_batch if chunk_workers is not None else model.transcribe_batch
+            result = transcribe_long(batch, speech, CHUNK_SECONDS, CHUNK_OVERLAP, **decode_options())
+            text = result['text'].strip()
+            trace['transcribe'] = time.perf_counter() - start
+            print(f"🧩 Decoded {result['chunks']} chunks in {trace['transcribe']:.1f}s")
+        else:
+            options = decode_options()
+            result = model.transcribe(speech, **options)
+            text = result.get('text', '').strip()
+            # Engines that can split language detection from decoding report both
+            trace.update(result.get('timings') or {'transcribe': time.perf_counter() - start})
+            remember_language(result, speech_duration)
+            log_decode(result, options, speech_duration, time.perf_counter() - start)
         
-        t = threading.Thread(target=transcribe_thread, daemon=True)
-        t.start()
+        print(f"✅ Transcription: {text[:100]}...")
         
+        if text:
+            # Copy transcription to clipboard
+            start = time.perf_counter()
+            pyperclip.copy(text)
+            # Small delay to ensure clipboard is set
+            time.sleep(0.05)
+            trace['clipboard'] = time.perf_counter() - start
+            # Send Ctrl+V to paste the transcription
+            start = time.perf_counter()
+            keyboard.send('ctrl+v')
+            time.sleep(0.05)
+            trace['paste'] = time.perf_counter() - start
+            
+            hide_popup()
+            if 'released_at' in trace:
+                trace['total'] = time.perf_counter() - trace['released_at']
+                print(f"✨ Transcription pasted! ({trace['total']:.2f}s after release)")
+            else:
+                print("✨ Transcription pasted!")
+            
+            # Save to database only after pasting; the writer thread does the I/O
+            row_future = save_to_database(text, duration, audio_file, speech_duration, trace,
+                                          'draft' if refiner is not None else None)
+            if audio_archive is not None:
+                archive_audio(audio, row_future)
+            if refiner is not None:
+                refiner.submit(row_future, speech)
+                refiner.touch()
+            elif summarizer is not None:
+                row_future.add_done_callback(summarizer.submit)
+        else:
+            hide_popup()
+            print("⚠️ No text captured")
     except Exception as e:
         hide_popup()
-        print(f"Error: {e}")
+        print(f"Error during transcription: {e}")
 
 
 def setup_hotkeys():
@@ -458,32 +1248,37 @@ def open_data_folder(icon=None, item=None):
     os.startfile(APP_DATA_DIR)
 
 
+def format_history(rows, preview: int = 100):
+    """Yield display lines for history rows (preview=None shows the full text)"""
+    for row in rows:
+        text = row['transcription']
+        if preview is not None and len(text) > preview:
+            text = text[:preview] + "..."
+        draft = ", draft" if row.get('status') == 'draft' else ""
+        yield f"📅 {row['timestamp']}  (#{row['id']}, {row['duration'] or 0:.1f}s{draft})\n"
+        yield f"📝 {text}\n\n"
+
+
 def open_database_viewer(icon=None, item=None):
     """Show recent transcriptions"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT timestamp, transcription
-            FROM transcriptions 
-            ORDER BY id DESC 
-            LIMIT 5
-        ''')
-        
-        rows = cursor.fetchall()
-        conn.close()
-        
-        output = "Recent Transcriptions:\n\n"
-        for timestamp, transcription in rows:
-            output += f"📅 {timestamp}\n"
-            output += f"📝 {transcription[:100]}...\n\n"
-        
-        print(output)
-        return output
+        page, _ = storage.history_page(DB_PATH, page_size=5)
+        print("Recent Transcriptions:\n")
+        for line in format_history(page):
+            print(line, end='')
     except Exception as e:
         print(f"Error reading database: {e}")
-        return f"Error: {e}"
+
+
+def print_history(cursor: str = None, since: str = None, until: str = None, page_size: int = 20,
+                  full: bool = False):
+    """Print one page of history and how to fetch the next one"""
+    page, next_cursor = storage.history_page(DB_PATH, storage.decode_cursor(cursor) if cursor else None,
+                                             since, until, page_size)
+    for line in format_history(page, preview=None if full else 100):
+        print(line, end='')
+    if next_cursor is not None:
+        print(f"Next page: --cursor \"{storage.encode_cursor(next_cursor)}\"")
 
 
 def create_tray():
@@ -496,6 +1291,20 @@ def create_tray():
             keyboard.unhook_all()
         except Exception:
             pass
+        # Make sure queued audio and transcriptions reach disk before exiting
+        # (unrefined drafts stay marked as drafts)
+        if armed_stream is not None:
+            armed_stream.close()
+        if refiner is not None:
+            refiner.close()
+        if summarizer is not None:
+            summarizer.close()
+        if chunk_workers is not None:
+            chunk_workers.close()
+        if audio_archive is not None:
+            audio_archive.close()
+        if db_writer is not None:
+            db_writer.close()
         try:
             icon.stop()
         except Exception:
@@ -505,6 +1314,20 @@ def create_tray():
     menu = pystray.Menu(
         pystray.MenuItem('📂 Open Data Folder', open_data_folder),
         pystray.MenuItem('📊 View Recent', open_database_viewer),
+        pystray.MenuItem('🔍 Search History', search_history),
+        pystray.MenuItem('⏱️ Latency Stats', show_latency_stats),
+        pystray.MenuItem('💤 Idle Wakeups', show_idle_wakeups),
+        pystray.MenuItem('🎛️ Decoding Profile', pystray.Menu(*[
+            pystray.MenuItem(name, lambda icon, item: set_decoding_profile(str(item)),
+                             checked=lambda item: decoding['profile'] == str(item), radio=True)
+            for name in DECODING_PROFILES])),
+        pystray.MenuItem('🎚️ Capture Budget', show_capture_budget, visible=lambda item: armed_stream is not None),
+        pystray.MenuItem(lambda item: f'⏳ Queued: {len(job_queue)}', None, enabled=False),
+        pystray.MenuItem(lambda item: f'🧠 {residency_status()}', None, enabled=False),
+        pystray.MenuItem(lambda item: f'🪄 Drafts to refine: {len(refiner)}', None, enabled=False,
+                         visible=lambda item: refiner is not None),
+        pystray.MenuItem(lambda item: f'📝 {summarizer.status()}', None, enabled=False,
+                         visible=lambda item: summarizer is not None),
         pystray.MenuItem('Quit', on_quit),
     )
     
@@ -528,17 +1351,29 @@ def main():
     """)
     
     # Setup
+    if DECODING_PROFILE not in DECODING_PROFILES:
+        print(f"⚠️ Unknown DECODING_PROFILE '{DECODING_PROFILE}', using balanced")
+        set_decoding_profile('balanced')
     setup_directories()
     setup_database()
+    setup_audio_archive()
+    setup_refiner()
+    setup_summarizer()
     
     # Start GUI thread for popup windows
     gui_thread = threading.Thread(target=gui_thread_func, daemon=True)
     gui_thread.start()
     time.sleep(0.5)  # Give GUI thread time to initialize
     
+    if ARMED_CAPTURE:
+        open_armed_stream()
     setup_hotkeys()
     
-    print("✅ Application started!")
+    # Load the model only now that hotkeys are live; recordings made in
+    # the meantime are queued and transcribed once it is ready
+    threading.Thread(target=transcription_worker_func, daemon=True).start()
+    
+    print(f"✅ Application started in {time.perf_counter() - START_TIME:.2f}s (model loading in background)")
     print("💡 Tip: Check tray icon menu for more options")
     
     # Create and run tray icon
@@ -546,5 +1381,33 @@ def main():
     icon.run()
 
 
+def cli():
+    """Command-line entry point; with no arguments, runs the tray service"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Voice2Text background speech-to-text service")
+    parser.add_argument('--stats', type=int, nargs='?', const=100, metavar='N',
+                        help="show per-stage latency over the last N utterances")
+    parser.add_argument('--search', metavar='QUERY', help="full-text search the history")
+    parser.add_argument('--history', action='store_true', help="list history, newest first")
+    parser.add_argument('--since', help="history from this UTC date/time (e.g. 2024-05-01)")
+    parser.add_argument('--until', help="history before this UTC date/time")
+    parser.add_argument('--cursor', help="continue history from a 'Next page' cursor")
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--full', action='store_true', help="show full transcriptions in history")
+    args = parser.parse_args()
+    
+    if args.stats is not None:
+        print(stage_latency_report(args.stats))
+    elif args.search:
+        storage.setup_database(DB_PATH)  # builds the index on first use
+        print(format_search_results(args.search))
+    elif args.history:
+        storage.setup_database(DB_PATH)
+        print_history(args.cursor, args.since, args.until, args.page_size, args.full)
+    else:
+        main()
+
+
 if __name__ == '__main__':
-    main()
+    cli()
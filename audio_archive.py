@@ -0,0 +1,116 @@
+import io
+import queue
+import struct
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+# Each record is a small header followed by one complete FLAC stream, so a
+# segment can be scanned without the index if it ever has to be rebuilt
+RECORD_MAGIC = b'V2TA'
+RECORD_HEADER = struct.Struct('<4sI')
+
+
+class AudioArchive:
+    """Append-only, FLAC-compressed store for utterance audio.
+
+    Utterances are appended to large segment files instead of one file each.
+    A locator string 'segment-000001.v2ta:offset:length' (kept in the
+    transcriptions.audio_file column) is the offset index: reading back any
+    utterance is one seek and one read. Whole segments are evicted, oldest
+    first, once the archive exceeds max_bytes or a segment is older than
+    max_age_days.
+    """
+
+    def __init__(self, directory, sample_rate: int, segment_bytes: int = 64 * 2**20,
+                 max_bytes: int = 1024 * 2**20, max_age_days: float = 30, on_evict=None):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.on_evict = on_evict  # called with the segment name after it is deleted
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def append_async(self, audio: np.ndarray, on_stored):
+        """Compress and append audio on the archive thread, then call on_stored(locator)"""
+        self.queue.put((audio, on_stored))
+
+    def close(self, timeout: float = 10.0):
+        """Finish pending appends and stop the archive thread"""
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def read(self, locator: str) -> np.ndarray:
+        """Return the float32 audio for a locator, or None if it has been evicted"""
+        segment, offset, length = locator.rsplit(':', 2)
+        path = self.directory / segment
+        try:
+            with open(path, 'rb') as f:
+                f.seek(int(offset))
+                data = f.read(int(length))
+        except FileNotFoundError:
+            return None
+        audio, _ = sf.read(io.BytesIO(data), dtype='float32')
+        return audio
+
+    def _segments(self) -> list:
+        return sorted(self.directory.glob('segment-*.v2ta'))
+
+    def _current_segment(self) -> Path:
+        segments = self._segments()
+        if segments and segments[-1].stat().st_size < self.segment_bytes:
+            return segments[-1]
+        number = int(segments[-1].stem.split('-')[1]) + 1 if segments else 1
+        return self.directory / f'segment-{number:06d}.v2ta'
+
+    def append(self, audio: np.ndarray) -> str:
+        """Compress and append one utterance; returns its locator"""
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, self.sample_rate, format='FLAC', subtype='PCM_16')
+        payload = buffer.getvalue()
+
+        path = self._current_segment()
+        with open(path, 'ab') as f:
+            f.write(RECORD_HEADER.pack(RECORD_MAGIC, len(payload)))
+            offset = f.tell()
+            f.write(payload)
+        return f'{path.name}:{offset}:{len(payload)}'
+
+    def evict(self):
+        """Delete the oldest segments until the archive is within its size and age limits"""
+        segments = self._segments()
+        total = sum(p.stat().st_size for p in segments)
+        cutoff = time.time() - self.max_age_days * 86400
+        # Never evict the segment currently being appended to
+        for path in segments[:-1]:
+            if total <= self.max_bytes and path.stat().st_mtime >= cutoff:
+                break
+            total -= path.stat().st_size
+            path.unlink()
+            print(f"🗑️ Evicted audio segment {path.name}")
+            if self.on_evict is not None:
+                self.on_evict(path.name)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            audio, on_stored = item
+            try:
+                locator = self.append(audio)
+                on_stored(locator)
+                self.evict()
+            except Exception as e:
+                print(f"Error archiving audio: {e}")
@@ -0,0 +1,103 @@
+import numpy as np
+
+
+def to_float32(samples: np.ndarray) -> np.ndarray:
+    """Convert integer PCM to float32 in [-1, 1), the format the models take"""
+    if not np.issubdtype(samples.dtype, np.integer):
+        return samples
+    return samples.astype(np.float32) / (np.iinfo(samples.dtype).max + 1)
+
+
+class AudioBuffer:
+    """Preallocated, growable mono capture buffer (int16 PCM or float32).
+
+    The sounddevice callback writes blocks straight into the backing array,
+    so there is no per-block allocation or queue hand-off in the audio thread.
+    Capacity doubles when full (rare with a sensible initial size) and is
+    capped at max_seconds; audio past the cap is dropped and counted.
+    """
+
+    def __init__(self, sample_rate: int, initial_seconds: float = 30.0, max_seconds: float = 600.0,
+                 dtype=np.float32):
+        self.sample_rate = sample_rate
+        self.max_samples = int(max_seconds * sample_rate)
+        self._data = np.zeros(min(int(initial_seconds * sample_rate), self.max_samples), dtype=dtype)
+        self._length = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return self._length
+
+    @property
+    def duration(self) -> float:
+        return self._length / self.sample_rate
+
+    def write(self, block: np.ndarray):
+        """Append a block of samples (1-D, or the first channel of a 2-D block)"""
+        if block.ndim == 2:
+            block = block[:, 0]
+        n = len(block)
+        end = self._length + n
+        if end > len(self._data):
+            self._grow(end)
+            if end > len(self._data):
+                self.dropped += end - len(self._data)
+                n = len(self._data) - self._length
+                end = len(self._data)
+        self._data[self._length:end] = block[:n]
+        # Publish the new length only after the samples are in place, so a
+        # reader taking view() from another thread never sees unwritten data
+        self._length = end
+
+    def _grow(self, needed: int):
+        capacity = len(self._data)
+        if capacity >= self.max_samples:
+            return
+        new_capacity = min(max(needed, capacity * 2), self.max_samples)
+        data = np.zeros(new_capacity, dtype=self._data.dtype)
+        data[:self._length] = self._data[:self._length]
+        self._data = data
+
+    def view(self, start: int = 0) -> np.ndarray:
+        """Return the captured samples from start onwards without copying"""
+        return self._data[start:self._length]
+
+
+class PrerollRing:
+    """Fixed-size ring that always holds the most recent samples.
+
+    Fed by an always-open input stream between recordings, so a recording
+    can start with the audio from just before the hotkey was pressed.
+    Writing overwrites in place; nothing is allocated per block.
+    """
+
+    def __init__(self, size: int, dtype=np.int16):
+        self._data = np.zeros(max(size, 1), dtype=dtype)
+        self._pos = 0
+        self._filled = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._data.nbytes
+
+    def write(self, block: np.ndarray):
+        size = len(self._data)
+        n = len(block)
+        if n >= size:
+            self._data[:] = block[-size:]
+            self._pos = 0
+        else:
+            end = self._pos + n
+            if end <= size:
+                self._data[self._pos:end] = block
+            else:
+                split = size - self._pos
+                self._data[self._pos:] = block[:split]
+                self._data[:n - split] = block[split:]
+            self._pos = end % size
+        self._filled = min(self._filled + n, size)
+
+    def snapshot(self) -> np.ndarray:
+        """Return a copy of the buffered samples, oldest first"""
+        ordered = np.concatenate((self._data[self._pos:], self._data[:self._pos]))
+        return ordered[len(ordered) - self._filled:]
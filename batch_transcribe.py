@@ -0,0 +1,177 @@
+"""
+Batch transcription of audio files and folders into the Voice2Text history.
+
+Files are decoded and resampled to 16 kHz by a pool of worker processes
+while the model transcribes earlier files, and results go into the same
+transcriptions table the hotkey service uses. Each file's path is stored in
+audio_file, so an interrupted run picks up where it left off.
+
+    python batch_transcribe.py C:\\Recordings\\meetings memo.m4a --workers 4
+"""
+import argparse
+import os
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+import storage
+from engines import DECODING_PROFILES, create_engine, decoding_options
+from long_form import transcribe_long
+from resample import resample
+from vad import trim_silence
+
+SAMPLE_RATE = 16000
+AUDIO_EXTENSIONS = {'.wav', '.flac', '.mp3', '.m4a', '.ogg', '.opus', '.webm', '.mp4', '.aac', '.wma'}
+DB_PATH = Path(os.path.expanduser('~')) / '.voz-pra-texto' / 'transcriptions.db'
+
+# Same configuration variables as the service
+MODEL_NAME = os.environ.get('WHISPER_MODEL', 'small')
+ENGINE_NAME = os.environ.get('TRANSCRIPTION_ENGINE', 'whisper')
+CPU_QUANTIZE = os.environ.get('CPU_QUANTIZE', '0') == '1'
+CPU_THREADS = int(os.environ.get('CPU_THREADS', '0'))
+VAD_ENABLED = os.environ.get('VAD', '1') == '1'
+LONG_FORM_SECONDS = float(os.environ.get('LONG_FORM_SECONDS', '60'))
+DECODING_PROFILE = os.environ.get('DECODING_PROFILE', 'balanced')
+WHISPER_LANGUAGE = os.environ.get('WHISPER_LANGUAGE', '')
+
+
+def decode_audio(path: str) -> np.ndarray:
+    """Decode a file to 16 kHz mono float32 (runs in a worker process).
+
+    Uses ffmpeg like openai-whisper does; without ffmpeg on PATH, formats
+    soundfile can read (wav, flac, ogg) still work.
+    """
+    cmd = ['ffmpeg', '-nostdin', '-v', 'error', '-i', path,
+           '-f', 's16le', '-ac', '1', '-ar', str(SAMPLE_RATE), '-']
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+        return np.frombuffer(out, np.int16).astype(np.float32) / 32768.0
+    except FileNotFoundError:
+        audio, rate = sf.read(path, dtype='float32', always_2d=True)
+        return resample(audio.mean(axis=1), rate, SAMPLE_RATE)
+
+
+def find_audio_files(inputs: list) -> list:
+    """Expand files and folders (recursively) into a sorted list of audio files"""
+    files = []
+    for item in inputs:
+        path = Path(item).resolve()
+        if path.is_dir():
+            files.extend(p for p in sorted(path.rglob('*')) if p.suffix.lower() in AUDIO_EXTENSIONS)
+        elif path.is_file():
+            files.append(path)
+        else:
+            print(f"⚠️ Not found: {item}")
+    return files
+
+
+def already_transcribed(db_path) -> set:
+    """Source paths that earlier runs have already saved"""
+    conn = storage.connect(db_path)
+    try:
+        return {row[0] for row in conn.execute('SELECT audio_file FROM transcriptions WHERE audio_file IS NOT NULL')}
+    finally:
+        conn.close()
+
+
+def decode_ahead(paths: list, workers: int):
+    """Yield (path, audio) in order while the pool decodes the next few files.
+
+    At most 2 x workers decoded files are held at once, which bounds memory
+    when the inputs are hour-long recordings.
+    """
+    remaining = iter(paths)
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()
+        for path in remaining:
+            pending.append((path, pool.submit(decode_audio, str(path))))
+            if len(pending) >= workers * 2:
+                break
+        while pending:
+            path, future = pending.popleft()
+            following = next(remaining, None)
+            if following is not None:
+                pending.append((following, pool.submit(decode_audio, str(following))))
+            try:
+                yield path, future.result()
+            except Exception as e:
+                print(f"⚠️ Could not decode {path.name}: {e}")
+
+
+def batched(items, size: int):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe audio files into the Voice2Text history")
+    parser.add_argument('inputs', nargs='+', help="audio files and/or folders")
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="decoder processes (default: half the cores)")
+    parser.add_argument('--batch-size', type=int, default=4, help="files per model batch")
+    parser.add_argument('--db', default=str(DB_PATH), help="database to write to")
+    parser.add_argument('--profile', default=DECODING_PROFILE, choices=list(DECODING_PROFILES),
+                        help="decoding profile (default: DECODING_PROFILE or balanced)")
+    args = parser.parse_args()
+
+    Path(args.db).parent.mkdir(parents=True, exist_ok=True)
+    storage.setup_database(args.db)
+    done = already_transcribed(args.db)
+    files = find_audio_files(args.inputs)
+    todo = [path for path in files if str(path) not in done]
+    print(f"📂 {len(files)} files, {len(files) - len(todo)} already transcribed, {len(todo)} to go")
+    if not todo:
+        return
+
+    print(f"Loading {ENGINE_NAME} model: {MODEL_NAME}")
+    engine = create_engine(ENGINE_NAME, MODEL_NAME, quantize=CPU_QUANTIZE, threads=CPU_THREADS)
+    # Files may be in different languages, so detection is only skipped when WHISPER_LANGUAGE pins one
+    options = decoding_options(args.profile, engine.device, WHISPER_LANGUAGE or None)
+    writer = storage.DatabaseWriter(args.db)
+    writer.start()
+
+    start = time.perf_counter()
+    audio_seconds = 0.0
+    count = 0
+    try:
+        for batch in batched(decode_ahead(todo, args.workers), args.batch_size):
+            speech = [trim_silence(audio, SAMPLE_RATE) if VAD_ENABLED else audio for _, audio in batch]
+            # Clips with no speech skip the model but are still recorded, so resume skips them too
+            # Long recordings are split into chunks that are batched on their own
+            long = [i for i, clip in enumerate(speech)
+                    if LONG_FORM_SECONDS > 0 and len(clip) > LONG_FORM_SECONDS * SAMPLE_RATE]
+            to_model = [i for i, clip in enumerate(speech) if len(clip) > 0 and i not in long]
+            results = dict(zip(to_model, engine.transcribe_batch([speech[i] for i in to_model], **options)))
+            for i in long:
+                results[i] = transcribe_long(engine.transcribe_batch, speech[i], **options)
+            for i, (path, audio) in enumerate(batch):
+                duration = len(audio) / SAMPLE_RATE
+                text = results[i].get('text', '').strip() if i in results else ''
+                writer.insert_transcription(text, duration, str(path), len(speech[i]) / SAMPLE_RATE)
+                audio_seconds += duration
+                count += 1
+                print(f"✅ [{count}/{len(todo)}] {path.name} ({duration / 60:.1f} min): {text[:80]}")
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted - finished files are saved, run again to resume")
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    if elapsed > 0 and count:
+        print(f"⏱️ {count} files, {audio_seconds / 3600:.2f} h of audio in {elapsed / 3600:.2f} h "
+              f"({audio_seconds / elapsed:.1f} audio-hours per wall-clock hour)")
+
+
+if __name__ == '__main__':
+    main()
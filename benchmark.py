@@ -0,0 +1,283 @@
+"""
+Headless benchmark for the record-to-paste pipeline.
+
+Feeds WAV fixtures through the service's own capture buffer, VAD,
+transcription and paste code, with the microphone, clipboard, keyboard and
+tray stubbed out, and reports latency percentiles, real-time factor, RSS,
+idle wakeups and word error rate per model and decoding profile.
+
+Fixtures: a folder of .wav files, each optionally next to a .txt file with
+the reference transcript (same name, e.g. note1.wav + note1.txt).
+
+    python benchmark.py fixtures/ --models tiny,base,small
+    python benchmark.py fixtures/ --models small --profiles fast,balanced,accurate
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+import numpy as np
+import soundfile as sf
+
+from metrics import normalize_words, wakeup_rate, word_error_rate
+
+SAMPLE_RATE = 16000
+BLOCK_SIZE = 1024  # samples per simulated PortAudio callback
+
+
+def install_stubs(pasted: list):
+    """Replace the desktop-only modules the service imports with no-op stand-ins.
+
+    The clipboard stub records what would have been pasted, so the benchmark
+    sees exactly the text the user would have received.
+    """
+    keyboard = types.ModuleType('keyboard')
+    keyboard.send = lambda *args, **kwargs: None
+    keyboard.add_hotkey = lambda *args, **kwargs: None
+    keyboard.hook = lambda *args, **kwargs: None
+    keyboard.unhook_all = lambda: None
+    sys.modules['keyboard'] = keyboard
+
+    pyperclip = types.ModuleType('pyperclip')
+    pyperclip.copy = pasted.append
+    pyperclip.paste = lambda: pasted[-1] if pasted else ''
+    sys.modules['pyperclip'] = pyperclip
+
+    sounddevice = types.ModuleType('sounddevice')
+    sounddevice.InputStream = StubStream
+    sounddevice.query_devices = lambda *args, **kwargs: {'default_samplerate': StubStream.rate}
+    sys.modules['sounddevice'] = sounddevice
+
+    pystray = types.ModuleType('pystray')
+    pystray.Icon = pystray.Menu = pystray.MenuItem = lambda *args, **kwargs: None
+    sys.modules['pystray'] = pystray
+
+    try:
+        import tkinter  # noqa: F401  (importing needs no display, only Tk() does)
+    except ImportError:
+        tkinter = types.ModuleType('tkinter')
+        tkinter.font = types.ModuleType('tkinter.font')
+        sys.modules['tkinter'] = tkinter
+        sys.modules['tkinter.font'] = tkinter.font
+
+
+class StubStream:
+    """Stands in for sd.InputStream; the benchmark drives the callback itself"""
+
+    rate = SAMPLE_RATE  # the "device" rate, set to each fixture's own rate
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def load_fixture(path: Path) -> tuple:
+    """Read a WAV as (mono int16, rate), the format a microphone at that rate delivers"""
+    audio, rate = sf.read(path, dtype='int16', always_2d=True)
+    return audio[:, 0].copy(), rate
+
+
+def find_fixtures(folder: Path) -> list:
+    fixtures = []
+    for wav in sorted(folder.glob('*.wav')):
+        ref = wav.with_suffix('.txt')
+        fixtures.append((wav, ref.read_text(encoding='utf-8').strip() if ref.exists() else None))
+    return fixtures
+
+
+def current_rss_mb() -> float:
+    """Resident set size right now, or None if it can't be measured here"""
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss / 2**20
+    except ImportError:
+        pass
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process, or None if unavailable"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reports kilobytes, macOS bytes
+        return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 2**20
+    except (ImportError, AttributeError):
+        return None
+
+
+def run_utterance(service, fixture: tuple, pasted: list) -> tuple:
+    """Push audio through capture, stop and transcribe exactly as a hotkey release would.
+
+    Returns (pasted text, seconds from release to paste).
+    """
+    audio, StubStream.rate = fixture
+    service.start_recording()
+    for start in range(0, len(audio), BLOCK_SIZE):
+        block = audio[start:start + BLOCK_SIZE].reshape(-1, 1)
+        service.audio_callback(block, len(block), None, None)
+
+    pasted.clear()
+    released = time.perf_counter()
+    service.stop_recording_and_transcribe()
+    # stop_recording_and_transcribe hands off to a thread that queues the job;
+    # run it here instead of on the worker so timing covers only this utterance
+    job = service.job_queue.get(timeout=10)
+    service.run_transcription(job['audio'], job['duration'], job['audio_file'], job['session'])
+    latency = time.perf_counter() - released
+    return (pasted[-1] if pasted else ''), latency
+
+
+def benchmark_model(model_name: str, fixture_dir: str, repeat: int, profiles: list) -> list:
+    """Load one model and run every fixture through it once per profile (runs in a fresh process)"""
+    os.environ['WHISPER_MODEL'] = model_name
+    os.environ['SAVE_AUDIO'] = '0'
+    os.environ['STREAMING'] = '0'
+    os.environ['CASCADE'] = '0'
+    pasted = []
+    install_stubs(pasted)
+    import app_background_service as service
+
+    # Keep benchmark rows out of the user's history
+    service.DB_PATH = Path(tempfile.mkdtemp()) / 'benchmark.db'
+    service.setup_database()
+    service.show_popup = service.hide_popup = service.update_popup = lambda *args: None
+
+    load_start = time.perf_counter()
+    service.load_model()
+    if service.model is None:
+        return [{'model': model_name, 'error': 'model failed to load'}]
+    service.model_ready.set()
+    load_time = time.perf_counter() - load_start
+    idle_rss = current_rss_mb()
+    # The worker blocks on the job queue, so an idle service should barely wake up
+    idle_wakeups = wakeup_rate(2)
+
+    fixtures = find_fixtures(Path(fixture_dir))
+    results = []
+    for profile in profiles:
+        service.set_decoding_profile(profile)
+        # One untimed pass so first-call overhead doesn't skew the percentiles
+        # (it also detects the language, as the first dictation of a session would)
+        run_utterance(service, load_fixture(fixtures[0][0]), pasted)
+
+        latencies, rtfs, rows = [], [], []
+        errors = ref_words = 0.0
+        for path, reference in fixtures:
+            fixture = load_fixture(path)
+            duration = len(fixture[0]) / fixture[1]
+            for _ in range(repeat):
+                text, latency = run_utterance(service, fixture, pasted)
+                latencies.append(latency)
+                rtfs.append(latency / duration)
+            row = {'file': path.name, 'duration': round(duration, 2), 'latency': round(latency, 3), 'text': text}
+            if reference is not None:
+                n = len(normalize_words(reference))
+                row['wer'] = round(word_error_rate(reference, text), 4)
+                errors += row['wer'] * n
+                ref_words += n
+            rows.append(row)
+
+        p50, p90, p95 = np.percentile(latencies, [50, 90, 95])
+        peak_rss = peak_rss_mb()
+        results.append({
+            'model': model_name,
+            'profile': profile,
+            'engine': service.ENGINE_NAME,
+            'device': service.DEVICE,
+            'load_time': round(load_time, 2),
+            'latency_p50': round(float(p50), 3),
+            'latency_p90': round(float(p90), 3),
+            'latency_p95': round(float(p95), 3),
+            'latency_max': round(max(latencies), 3),
+            'rtf_mean': round(float(np.mean(rtfs)), 3),
+            'idle_rss_mb': round(idle_rss, 1) if idle_rss is not None else None,
+            'peak_rss_mb': round(peak_rss, 1) if peak_rss is not None else None,
+            'idle_wakeups': round(idle_wakeups, 1) if idle_wakeups is not None else None,
+            'wer': round(errors / ref_words, 4) if ref_words else None,
+            'files': rows,
+        })
+    return results
+
+
+def format_optional(value, spec: str) -> str:
+    return format(value, spec) if value is not None else '-'
+
+
+def print_report(results: list):
+    header = (f"{'model':<10} {'profile':<9} {'p50':>7} {'p90':>7} {'p95':>7} {'RTF':>6} {'idle MB':>8} "
+              f"{'peak MB':>8} {'wake/s':>7} {'WER':>7}")
+    print("\n" + header)
+    print("-" * len(header))
+    for r in results:
+        if 'error' in r:
+            print(f"{r['model']:<10} {'':<9} {r['error']}")
+            continue
+        print(f"{r['model']:<10} {r['profile']:<9} {r['latency_p50']:>6.2f}s {r['latency_p90']:>6.2f}s "
+              f"{r['latency_p95']:>6.2f}s "
+              f"{r['rtf_mean']:>6.2f} {format_optional(r['idle_rss_mb'], '>8.0f')} "
+              f"{format_optional(r['peak_rss_mb'], '>8.0f')} {format_optional(r['idle_wakeups'], '>7.1f')} "
+              f"{format_optional(r['wer'], '>7.1%')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Voice2Text record-to-paste pipeline")
+    parser.add_argument('fixtures', help="folder of .wav files (with optional .txt references)")
+    parser.add_argument('--models', default=os.environ.get('WHISPER_MODEL', 'small'),
+                        help="comma-separated models to compare (default: WHISPER_MODEL or small)")
+    parser.add_argument('--profiles', default=os.environ.get('DECODING_PROFILE', 'balanced'),
+                        help="comma-separated decoding profiles to compare on each model (fast,balanced,accurate)")
+    parser.add_argument('--repeat', type=int, default=1, help="timed runs per fixture")
+    parser.add_argument('--json', help="also write full results to this file")
+    args = parser.parse_args()
+
+    if not find_fixtures(Path(args.fixtures)):
+        parser.error(f"no .wav files in {args.fixtures}")
+
+    profiles = [p.strip() for p in args.profiles.split(',')]
+    from engines import DECODING_PROFILES
+    unknown = [p for p in profiles if p not in DECODING_PROFILES]
+    if unknown:
+        parser.error(f"unknown profile(s) {', '.join(unknown)} (choose from {', '.join(DECODING_PROFILES)})")
+
+    # Each model runs in its own process so RSS numbers aren't cumulative
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for model_name in args.models.split(','):
+        print(f"⏱️ Benchmarking {model_name}...")
+        with ctx.Pool(1) as pool:
+            results.extend(pool.apply(benchmark_model, (model_name.strip(), args.fixtures, args.repeat, profiles)))
+
+    print_report(results)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,341 @@
+import copy
+import os
+import time
+
+import numpy as np
+
+from metrics import word_error_rate
+
+SAMPLE_RATE = 16000
+
+# Decoding profiles: transcribe() options trading accuracy for latency.
+# beam_size None is greedy search; a tuple of temperatures re-decodes a
+# segment at the next one whenever it looks degenerate (openai-whisper's
+# default goes through six); fp16 applies only on a GPU. cache_language lets
+# the caller reuse the language detected earlier in the session instead of
+# paying for detection on every utterance
+DECODING_PROFILES = {
+    'fast': {'beam_size': None, 'best_of': None, 'temperature': 0.0,
+             'condition_on_previous_text': False, 'fp16': True, 'cache_language': True},
+    'balanced': {'beam_size': None, 'best_of': 3, 'temperature': (0.0, 0.4, 0.8),
+                 'condition_on_previous_text': True, 'fp16': True, 'cache_language': False},
+    'accurate': {'beam_size': 5, 'best_of': 5, 'temperature': (0.0, 0.2, 0.4, 0.6, 0.8, 1.0),
+                 'condition_on_previous_text': True, 'fp16': False, 'cache_language': False},
+}
+
+
+class TranscriptionEngine:
+    """Speech-to-text backend.
+
+    transcribe() takes 16 kHz mono float32 audio and returns a dict with
+    'text' and 'segments' (each segment a dict with 'start', 'end' and 'text',
+    times in seconds), the same shape openai-whisper returns. Backends import
+    their runtime lazily so that unused ones don't need to be installed.
+    """
+
+    name = 'base'
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.device = 'cpu'
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: str = None, **options) -> dict:
+        raise NotImplementedError
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        """Transcribe several clips; backends that can batch on the device override this"""
+        return [self.transcribe(audio, **options) for audio in audios]
+
+
+class WhisperEngine(TranscriptionEngine):
+    """openai-whisper (PyTorch), with an optional CPU performance mode"""
+
+    name = 'whisper'
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: int = 0, compare_audio: str = ''):
+        super().__init__(model_name)
+        import torch
+        import whisper
+
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = whisper.load_model(model_name, device=self.device)
+        if self.device == 'cpu':
+            self.model = tune_cpu_model(self.model, quantize, threads, compare_audio)
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: str = None, **options) -> dict:
+        """Transcribe, timing language detection separately from decoding.
+
+        whisper.transcribe() would detect the language itself from the first
+        30 s; doing that step here gives the same result and lets us time it.
+        """
+        import whisper
+
+        timings = {}
+        if options.get('language') is None and not self.model.is_multilingual:
+            options['language'] = 'en'  # *.en checkpoints have no language tokens to detect with
+        if options.get('language') is None:
+            start = time.perf_counter()
+            n_mels = getattr(self.model.dims, 'n_mels', 80)
+            mel = whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels).to(self.device)
+            _, probs = self.model.detect_language(mel)
+            options['language'] = max(probs, key=probs.get)
+            timings['language_detection'] = time.perf_counter() - start
+        start = time.perf_counter()
+        result = self.model.transcribe(audio, initial_prompt=initial_prompt, **options)
+        timings['decode'] = time.perf_counter() - start
+        result['timings'] = timings
+        return result
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        """Decode clips of up to 30 s together as one batch on the device.
+
+        whisper.decode() accepts a batch of spectrograms where transcribe()
+        does not. Unless a language is given, whisper.decode() detects it
+        per clip, since the clips may be unrelated recordings. Longer clips, and clips whose batched decode looks degenerate (repetition
+        loops or very low confidence, whisper's own thresholds), go through
+        transcribe(), which retries at higher temperatures (unless the
+        options allow only one temperature, when it would decode the same),
+        in the language detected for that clip.
+        """
+        import torch
+        import whisper
+
+        if options.get('language') is None and not self.model.is_multilingual:
+            options['language'] = 'en'
+        results = [None] * len(audios)
+        languages = [options.get('language')] * len(audios)
+        retries = not isinstance(options.get('temperature', ()), (int, float))
+        short = [i for i, audio in enumerate(audios) if len(audio) <= whisper.audio.N_SAMPLES]
+        if short:
+            n_mels = getattr(self.model.dims, 'n_mels', 80)
+            mel = torch.stack([whisper.log_mel_spectrogram(whisper.pad_or_trim(audios[i]), n_mels)
+                               for i in short]).to(self.device)
+            decode_options = whisper.DecodingOptions(
+                language=options.get('language'), beam_size=options.get('beam_size'),
+                fp16=options.get('fp16', self.device == 'cuda'), prompt=options.get('initial_prompt'),
+                without_timestamps=True)
+            for i, decoded in zip(short, whisper.decode(self.model, mel, decode_options)):
+                languages[i] = decoded.language
+                if retries and (decoded.compression_ratio > 2.4 or decoded.avg_logprob < -1.0):
+                    continue
+                end = len(audios[i]) / SAMPLE_RATE
+                results[i] = {'text': decoded.text, 'language': decoded.language,
+                              'segments': [{'start': 0.0, 'end': end, 'text': decoded.text}]}
+        return [result if result is not None else self.transcribe(audio, **{**options, 'language': language})
+                for result, audio, language in zip(results, audios, languages)]
+
+
+class FasterWhisperEngine(TranscriptionEngine):
+    """CTranslate2 via faster-whisper: int8 on CPU, float16 on GPU"""
+
+    name = 'faster-whisper'
+
+    def __init__(self, model_name: str, threads: int = 0, compute_type: str = ''):
+        super().__init__(model_name)
+        import ctranslate2
+        from faster_whisper import WhisperModel
+
+        self.device = 'cuda' if ctranslate2.get_cuda_device_count() > 0 else 'cpu'
+        compute_type = compute_type or ('float16' if self.device == 'cuda' else 'int8')
+        self.model = WhisperModel(model_name, device=self.device, compute_type=compute_type, cpu_threads=threads)
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: str = None, **options) -> dict:
+        # faster-whisper has no fp16 switch; precision is fixed by compute_type
+        options.pop('fp16', None)
+        if 'beam_size' in options and options['beam_size'] is None:
+            options['beam_size'] = 1  # greedy, like openai-whisper's beam_size=None
+        options = {key: value for key, value in options.items() if value is not None}
+        segments, info = self.model.transcribe(audio, initial_prompt=initial_prompt, **options)
+        segments = [{'start': s.start, 'end': s.end, 'text': s.text} for s in segments]
+        return {'text': ''.join(s['text'] for s in segments), 'segments': segments, 'language': info.language}
+
+
+class OnnxEngine(TranscriptionEngine):
+    """ONNX Runtime via Hugging Face optimum (exports the model on first use)"""
+
+    name = 'onnx'
+
+    def __init__(self, model_name: str, threads: int = 0):
+        super().__init__(model_name)
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import WhisperProcessor, pipeline
+
+        repo = model_name if '/' in model_name else f'openai/whisper-{model_name}'
+        providers = onnxruntime.get_available_providers()
+        self.device = 'cuda' if 'CUDAExecutionProvider' in providers else 'cpu'
+        session_options = onnxruntime.SessionOptions()
+        if threads > 0:
+            session_options.intra_op_num_threads = threads
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(
+            repo, export=True, session_options=session_options,
+            provider='CUDAExecutionProvider' if self.device == 'cuda' else 'CPUExecutionProvider')
+        processor = WhisperProcessor.from_pretrained(repo)
+        self.pipe = pipeline('automatic-speech-recognition', model=model, tokenizer=processor.tokenizer,
+                             feature_extractor=processor.feature_extractor, chunk_length_s=30)
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: str = None, **options) -> dict:
+        # The transformers pipeline takes no text prompt, so initial_prompt is ignored
+        result = self.pipe({'raw': audio, 'sampling_rate': SAMPLE_RATE}, return_timestamps=True,
+                           generate_kwargs=self._generate_kwargs(options))
+        return self._to_result(result)
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        """Run all clips through the pipeline as one batch"""
+        inputs = [{'raw': audio, 'sampling_rate': SAMPLE_RATE} for audio in audios]
+        results = self.pipe(inputs, return_timestamps=True, batch_size=len(inputs),
+                            generate_kwargs=self._generate_kwargs(options))
+        return [self._to_result(result) for result in results]
+
+    @staticmethod
+    def _generate_kwargs(options: dict) -> dict:
+        generate_kwargs = {}
+        if options.get('language'):
+            generate_kwargs['language'] = options['language']
+        if options.get('beam_size'):
+            generate_kwargs['num_beams'] = options['beam_size']
+        return generate_kwargs
+
+    @staticmethod
+    def _to_result(result: dict) -> dict:
+        segments = [{'start': c['timestamp'][0] or 0.0, 'end': c['timestamp'][1] or 0.0, 'text': c['text']}
+                    for c in result.get('chunks', [])]
+        return {'text': result['text'], 'segments': segments}
+
+
+class DaemonEngine(TranscriptionEngine):
+    """Client of a shared transcription_daemon.py, which holds the only copy of the model.
+
+    The daemon's own engine and model are used; WHISPER_MODEL and the CPU
+    settings only apply where the daemon runs.
+    """
+
+    name = 'daemon'
+
+    def __init__(self, model_name: str, url: str = ''):
+        super().__init__(model_name)
+        from transcription_daemon import DEFAULT_URL, DaemonClient
+
+        self.client = DaemonClient(url or os.environ.get('TRANSCRIPTION_DAEMON_URL', DEFAULT_URL))
+        info = self.client.health()
+        self.model_name = info['model']
+        self.device = info['device']
+
+    def transcribe(self, audio: np.ndarray, initial_prompt: str = None, **options) -> dict:
+        if initial_prompt is not None:
+            options['initial_prompt'] = initial_prompt
+        return self.client.transcribe(audio, **options)
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        """Send the clips concurrently so the daemon can decode them as one batch"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max(1, len(audios))) as pool:
+            return list(pool.map(lambda audio: self.client.transcribe(audio, **options), audios))
+
+
+ENGINES = {
+    WhisperEngine.name: WhisperEngine,
+    FasterWhisperEngine.name: FasterWhisperEngine,
+    OnnxEngine.name: OnnxEngine,
+    DaemonEngine.name: DaemonEngine,
+}
+
+
+def decoding_options(profile: str, device: str, language: str = None) -> dict:
+    """transcribe() options for a decoding profile on this device, optionally with a fixed language"""
+    if profile not in DECODING_PROFILES:
+        raise ValueError(f"Unknown decoding profile '{profile}' (choose from {', '.join(DECODING_PROFILES)})")
+    options = {key: value for key, value in DECODING_PROFILES[profile].items() if key != 'cache_language'}
+    options['fp16'] = options['fp16'] and device == 'cuda'
+    if language:
+        options['language'] = language
+    return options
+
+
+def create_engine(engine_name: str, model_name: str, quantize: bool = False, threads: int = 0,
+                  affinity: str = '', compare_audio: str = '') -> TranscriptionEngine:
+    """Instantiate the backend selected by name (e.g. from TRANSCRIPTION_ENGINE)"""
+    if engine_name not in ENGINES:
+        raise ValueError(f"Unknown transcription engine '{engine_name}' (choose from {', '.join(ENGINES)})")
+    if affinity:
+        pin_to_cores(parse_core_list(affinity))
+    if engine_name == WhisperEngine.name:
+        return WhisperEngine(model_name, quantize=quantize, threads=threads, compare_audio=compare_audio)
+    if engine_name == DaemonEngine.name:
+        return DaemonEngine(model_name)
+    return ENGINES[engine_name](model_name, threads=threads)
+
+
+def parse_core_list(spec: str) -> set:
+    """Parse a core list like '0-3,6' into {0, 1, 2, 3, 6}"""
+    cores = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if '-' in part:
+            first, last = part.split('-')
+            cores.update(range(int(first), int(last) + 1))
+        elif part:
+            cores.add(int(part))
+    return cores
+
+
+def pin_to_cores(cores: set):
+    """Restrict the process to the given cores"""
+    if hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    else:
+        # Windows has no os.sched_setaffinity; psutil is optional
+        try:
+            import psutil
+            psutil.Process().cpu_affinity(sorted(cores))
+        except ImportError:
+            print("⚠️ CPU_AFFINITY needs psutil on this platform (pip install psutil)")
+            return
+    print(f"📌 Pinned to cores {sorted(cores)}")
+
+
+def tune_cpu_model(cpu_model, quantize: bool, threads: int, compare_audio: str):
+    """Apply the thread budget and int8 quantization to a CPU whisper model"""
+    import torch
+
+    if threads > 0:
+        torch.set_num_threads(threads)
+    print(f"🧵 Using {torch.get_num_threads()} intra-op threads")
+
+    if not quantize:
+        return cpu_model
+
+    baseline = copy.deepcopy(cpu_model) if compare_audio else None
+
+    # Whisper uses its own nn.Linear subclass, which quantize_dynamic skips;
+    # on CPU it behaves exactly like nn.Linear, so swap the class first
+    for module in cpu_model.modules():
+        if isinstance(module, torch.nn.Linear):
+            module.__class__ = torch.nn.Linear
+    cpu_model = torch.quantization.quantize_dynamic(cpu_model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    print("🗜️ Quantized linear layers to int8")
+
+    if baseline is not None:
+        compare_quantized(baseline, cpu_model, compare_audio)
+    return cpu_model
+
+
+def compare_quantized(baseline, quantized, audio_path: str):
+    """Report latency and accuracy of the int8 model against the float32 baseline"""
+    import whisper
+
+    try:
+        audio = whisper.load_audio(audio_path)
+        results = {}
+        for label, candidate in (('float32', baseline), ('int8', quantized)):
+            candidate.transcribe(audio[:SAMPLE_RATE])  # discard first-call overhead
+            start = time.perf_counter()
+            text = candidate.transcribe(audio).get('text', '').strip()
+            results[label] = (time.perf_counter() - start, text)
+        base_time, base_text = results['float32']
+        int8_time, int8_text = results['int8']
+        print(f"📊 float32 {base_time:.2f}s vs int8 {int8_time:.2f}s ({base_time / int8_time:.1f}x), "
+              f"int8 WER vs float32: {word_error_rate(base_text, int8_text):.1%}")
+    except Exception as e:
+        print(f"Error comparing quantized model: {e}")
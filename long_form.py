@@ -0,0 +1,109 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from metrics import normalize_words
+from vad import split_at_silences
+
+SAMPLE_RATE = 16000
+
+
+def stitch(texts: list, max_overlap_words: int = 15) -> str:
+    """Join chunk transcripts, dropping words repeated across each overlap.
+
+    Where two chunks overlap, the end of one transcript and the start of the
+    next usually repeat the same few words; the longest such run (compared
+    without case or punctuation) is removed from the later chunk. A lone
+    short word is not treated as a repeat, since "the the" across a cut is
+    more often real speech.
+    """
+    def key(word: str) -> str:
+        return ''.join(normalize_words(word))
+
+    words = []
+    for text in texts:
+        new = text.split()
+        tail = [key(w) for w in words[-max_overlap_words:]]
+        head = [key(w) for w in new[:max_overlap_words]]
+        skip = 0
+        for n in range(min(len(tail), len(head)), 0, -1):
+            if head[:n] == tail[-n:] and (n > 1 or len(head[0]) > 3):
+                skip = n
+                break
+        words.extend(new[skip:])
+    return ' '.join(words)
+
+
+def transcribe_long(transcribe_batch, audio: np.ndarray, chunk_seconds: float = 25.0,
+                    overlap_seconds: float = 1.0, **options) -> dict:
+    """Transcribe a long recording as overlapping chunks decoded together.
+
+    transcribe_batch is an engine's transcribe_batch (one batch on the
+    device) or ChunkWorkers.transcribe_batch (one chunk per CPU process).
+    Returns the usual result dict, with segment times relative to audio.
+    """
+    chunks = split_at_silences(audio, SAMPLE_RATE, chunk_seconds, overlap_seconds=overlap_seconds)
+    results = transcribe_batch([audio[start:end] for start, end in chunks], **options)
+    segments = []
+    for (start, _), result in zip(chunks, results):
+        offset = start / SAMPLE_RATE
+        segments.extend({'start': s['start'] + offset, 'end': s['end'] + offset, 'text': s['text']}
+                        for s in result.get('segments', []))
+    return {'text': stitch([result.get('text', '') for result in results]), 'segments': segments,
+            'chunks': len(chunks)}
+
+
+_worker_engine = None  # the engine loaded in each ChunkWorkers process
+
+
+def _load_worker_engine(engine_name: str, model_name: str, quantize: bool, threads: int):
+    global _worker_engine
+    from engines import create_engine
+
+    _worker_engine = create_engine(engine_name, model_name, quantize=quantize, threads=threads)
+
+
+def _worker_ready() -> bool:
+    return _worker_engine is not None
+
+
+def _transcribe_in_worker(audio: np.ndarray, options: dict) -> dict:
+    result = _worker_engine.transcribe(audio, **options)
+    return {'text': result.get('text', ''), 'segments': result.get('segments', [])}
+
+
+class ChunkWorkers:
+    """Pool of processes, each with its own copy of the model, for decoding chunks on CPU.
+
+    Every process gets an equal share of the cores as its thread budget, so
+    the chunks of one recording decode side by side instead of one after
+    another. start() launches the pool and loads its model copies in the
+    background (otherwise the first long recording waits for them); the
+    pool is kept for later recordings.
+    """
+
+    def __init__(self, workers: int, engine_name: str, model_name: str, quantize: bool = False):
+        self.workers = workers
+        self.initargs = (engine_name, model_name, quantize, max(1, (os.cpu_count() or workers) // workers))
+        self.pool = None
+
+    def start(self):
+        if self.pool is not None:
+            return
+        print(f"Starting {self.workers} chunk decoding processes ({self.initargs[3]} threads each)")
+        # spawn: forking a process that runs Tk and audio threads is unsafe
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_load_worker_engine, initargs=self.initargs)
+        # One no-op job per process, so all of them start and load now
+        for _ in range(self.workers):
+            self.pool.submit(_worker_ready)
+
+    def transcribe_batch(self, audios: list, **options) -> list:
+        self.start()
+        return list(self.pool.map(_transcribe_in_worker, audios, [options] * len(audios)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
@@ -0,0 +1,57 @@
+import glob
+import re
+import time
+
+
+def normalize_words(text: str) -> list:
+    """Lowercase and strip punctuation so WER compares words, not formatting"""
+    return re.sub(r"[^\w\s']", ' ', text.lower()).split()
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # Single-row dynamic programming over the hypothesis words
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev_diag, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev_diag, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev_diag + (r != h))
+    return row[-1] / len(ref)
+
+
+def voluntary_context_switches() -> int:
+    """Times this process's threads have gone to sleep and been woken, or None if unavailable.
+
+    Each count is one wakeup (a timer firing, a poll returning, an event
+    arriving), which is what keeps an idle CPU out of its low-power states.
+    """
+    try:
+        total = 0
+        for path in glob.glob('/proc/self/task/*/status'):
+            with open(path) as f:
+                for line in f:
+                    if line.startswith('voluntary_ctxt_switches:'):
+                        total += int(line.split()[1])
+        if total:
+            return total
+    except OSError:
+        pass
+    try:
+        import psutil
+        return psutil.Process().num_ctx_switches().voluntary
+    except ImportError:
+        return None
+
+
+def wakeup_rate(seconds: float = 10.0) -> float:
+    """Average wakeups per second of this process over the next few seconds"""
+    before = voluntary_context_switches()
+    if before is None:
+        return None
+    time.sleep(seconds)
+    # The measuring thread itself wakes once, at the end of its sleep
+    return (voluntary_context_switches() - before - 1) / seconds
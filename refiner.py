@@ -0,0 +1,91 @@
+import threading
+import time
+from collections import deque
+
+
+class Refiner:
+    """Re-transcribes draft utterances with a larger model while the user is idle.
+
+    Drafts are queued as (row, audio) pairs, where row is a transcriptions id
+    or a Future for one, and audio is the float32 samples or an archive
+    locator that read_audio() turns back into samples. The refine engine is
+    loaded by load_engine() on first use. Work starts only after idle_seconds
+    without activity (see touch()) and while is_busy() is false, one
+    utterance at a time, so it never competes with dictation for long.
+    Finished text is handed to on_refined(row_id, text, seconds).
+    """
+
+    def __init__(self, load_engine, on_refined, is_busy=None, read_audio=None,
+                 idle_seconds: float = 30, max_pending: int = 20):
+        self.load_engine = load_engine
+        self.on_refined = on_refined
+        self.is_busy = is_busy or (lambda: False)
+        self.read_audio = read_audio
+        self.idle_seconds = idle_seconds
+        # Past this many drafts the oldest are left as drafts
+        self.pending = deque(maxlen=max_pending)
+        self.cond = threading.Condition()
+        self.last_activity = time.monotonic()
+        self.closed = False
+        self.engine = None
+        self.thread = None
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, row, audio):
+        """Queue a draft for refinement"""
+        with self.cond:
+            self.pending.append((row, audio))
+            self.cond.notify()
+
+    def touch(self):
+        """Note user activity; refinement waits for idle_seconds after the last one"""
+        self.last_activity = time.monotonic()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def _next_idle_item(self):
+        """Block until there is a draft and the machine has been idle long enough"""
+        with self.cond:
+            while not self.closed:
+                if not self.pending:
+                    self.cond.wait()
+                    continue
+                remaining = self.last_activity + self.idle_seconds - time.monotonic()
+                if remaining > 0:
+                    self.cond.wait(remaining)
+                    continue
+                if self.is_busy():
+                    # Something else is using the machine; look again a full idle period later
+                    self.last_activity = time.monotonic()
+                    continue
+                return self.pending.popleft()
+        return None
+
+    def _run(self):
+        while True:
+            item = self._next_idle_item()
+            if item is None:
+                return
+            row, audio = item
+            try:
+                if self.engine is None:
+                    self.engine = self.load_engine()
+                if isinstance(audio, str):
+                    audio = self.read_audio(audio)
+                    if audio is None or len(audio) == 0:
+                        continue  # evicted from the archive; the row stays a draft
+                row_id = row if isinstance(row, int) else row.result(timeout=30)
+                start = time.perf_counter()
+                text = self.engine.transcribe(audio).get('text', '').strip()
+                self.on_refined(row_id, text, time.perf_counter() - start)
+            except Exception as e:
+                print(f"Refinement error: {e}")
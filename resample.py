@@ -0,0 +1,86 @@
+from math import gcd
+
+import numpy as np
+
+
+class PolyphaseResampler:
+    """Streaming rational-ratio resampler (e.g. 48000 or 44100 Hz -> 16000 Hz).
+
+    Upsamples by L, low-pass filters and downsamples by M, but only ever
+    computes the output samples: each one is a dot product of the last few
+    input samples with one phase of a Kaiser-windowed sinc filter. process()
+    takes blocks as they arrive from the audio callback and returns the
+    output they complete, vectorized over the whole block; flush() returns
+    the rest at the end. Integer input (e.g. int16 PCM) gives integer output
+    at the same scale.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int, zero_crossings: int = 16, beta: float = 8.0):
+        g = gcd(int(from_rate), int(to_rate))
+        self.up = int(to_rate) // g
+        self.down = int(from_rate) // g
+
+        # Prototype low-pass at the upsampled rate, cut off below the lower Nyquist
+        factor = max(self.up, self.down)
+        length = 2 * zero_crossings * factor + 1
+        t = (np.arange(length) - (length - 1) / 2) / factor
+        h = np.sinc(t) * np.kaiser(length, beta)
+        h *= self.up / h.sum()
+
+        # phases[p, k] = h[p + k * up]: the taps applied to x[m], x[m - 1], ...
+        self.taps = -(-length // self.up)
+        padded = np.zeros(self.taps * self.up)
+        padded[:length] = h
+        self.phases = padded.reshape(self.taps, self.up).T.astype(np.float32)
+        self.delay = (length - 1) // 2  # group delay, in upsampled samples
+
+        self.tail = np.zeros(self.taps - 1, dtype=np.float32)  # input kept for the next block
+        self.offset = -(self.taps - 1)  # input index of tail[0]
+        self.produced = 0  # output samples returned so far
+        self.consumed = 0  # input samples received so far
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        """Resample the next block; returns every output sample it completes"""
+        dtype = block.dtype
+        x = np.concatenate((self.tail, block.astype(np.float32, copy=False)))
+        self.consumed += len(block)
+
+        # Output n needs input up to m = (n * down + delay) // up
+        last = self.offset + len(x) - 1
+        end = ((last + 1) * self.up - self.delay - 1) // self.down + 1
+        n = np.arange(self.produced, max(end, self.produced))
+        u = n * self.down + self.delay
+        m = u // self.up
+        index = (m - self.offset)[:, None] - np.arange(self.taps)[None, :]
+        y = np.einsum('ij,ij->i', self.phases[u % self.up], x[index])
+        self.produced += len(n)
+
+        keep = (self.produced * self.down + self.delay) // self.up - (self.taps - 1) - self.offset
+        keep = min(max(keep, 0), len(x))
+        self.tail = x[keep:]
+        self.offset += keep
+
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            return np.clip(np.rint(y), info.min, info.max).astype(dtype)
+        return y.astype(dtype, copy=False)
+
+    def flush(self, dtype=np.float32) -> np.ndarray:
+        """Return the output still held back by the filter delay"""
+        expected = -(-self.consumed * self.up // self.down)
+        remaining = expected - self.produced
+        if remaining <= 0:
+            return np.zeros(0, dtype=dtype)
+        consumed = self.consumed
+        y = self.process(np.zeros(self.delay // self.up + self.taps + 1, dtype=dtype))
+        self.consumed = consumed
+        self.produced = expected
+        return y[:remaining]
+
+
+def resample(audio: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """Resample a whole clip (same dtype out as in)"""
+    if from_rate == to_rate:
+        return audio
+    resampler = PolyphaseResampler(from_rate, to_rate)
+    return np.concatenate((resampler.process(audio), resampler.flush(audio.dtype)))
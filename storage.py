@@ -0,0 +1,363 @@
+import queue
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+
+def connect(db_path) -> sqlite3.Connection:
+    """Open a connection in WAL mode, so readers never block the writer"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    # In WAL mode NORMAL only syncs at checkpoints; a power cut can lose the
+    # last few commits but never corrupts the database
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def setup_database(db_path):
+    """Initialize SQLite database for storing transcriptions and summaries"""
+    conn = connect(db_path)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transcriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            timestamp TEXT NOT NULL,
+            audio_file TEXT,
+            transcription TEXT NOT NULL,
+            summary TEXT,
+            duration REAL,
+            speech_duration REAL,
+            status TEXT,
+            draft_transcription TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Per-stage latency of each utterance, for finding where time goes
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stage_timings (
+            transcription_id INTEGER NOT NULL REFERENCES transcriptions(id),
+            stage TEXT NOT NULL,
+            seconds REAL NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stage_timings_transcription ON stage_timings(transcription_id)')
+
+    # Older databases predate these columns. status is 'draft' while a
+    # cascade refinement is pending and 'final' once the larger model has
+    # replaced the text (the draft is kept in draft_transcription); NULL
+    # means the text was never meant to be refined. summary_model says what
+    # wrote the summary ('extractive' when the LLM was unavailable)
+    columns = {row[1] for row in cursor.execute('PRAGMA table_info(transcriptions)')}
+    for column, column_type in (('speech_duration', 'REAL'), ('status', 'TEXT'), ('draft_transcription', 'TEXT'),
+                                ('summary_model', 'TEXT')):
+        if column not in columns:
+            cursor.execute(f'ALTER TABLE transcriptions ADD COLUMN {column} {column_type}')
+
+    # Keyset pagination and date filters walk this index instead of scanning
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transcriptions_created_at ON transcriptions(created_at, id)')
+
+    setup_search_index(conn)
+
+    conn.commit()
+    conn.close()
+
+
+def setup_search_index(conn: sqlite3.Connection):
+    """Create the FTS5 index over transcriptions, kept in sync by triggers.
+
+    The index is external-content (it stores only the tokens, the text stays
+    in transcriptions). Databases created before the index existed are
+    backfilled once.
+    """
+    existed = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transcriptions_fts'").fetchone()
+    try:
+        conn.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS transcriptions_fts USING fts5(
+                transcription, summary,
+                content='transcriptions', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"⚠️ Full-text search unavailable ({e}), falling back to slow search")
+        return
+
+    conn.executescript('''
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_insert AFTER INSERT ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(rowid, transcription, summary)
+            VALUES (new.id, new.transcription, new.summary);
+        END;
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_delete AFTER DELETE ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcription, summary)
+            VALUES ('delete', old.id, old.transcription, old.summary);
+        END;
+        CREATE TRIGGER IF NOT EXISTS transcriptions_fts_update AFTER UPDATE OF transcription, summary
+        ON transcriptions BEGIN
+            INSERT INTO transcriptions_fts(transcriptions_fts, rowid, transcription, summary)
+            VALUES ('delete', old.id, old.transcription, old.summary);
+            INSERT INTO transcriptions_fts(rowid, transcription, summary)
+            VALUES (new.id, new.transcription, new.summary);
+        END;
+    ''')
+
+    if not existed:
+        conn.execute("INSERT INTO transcriptions_fts(transcriptions_fts) VALUES ('rebuild')")
+        count = conn.execute('SELECT COUNT(*) FROM transcriptions').fetchone()[0]
+        print(f"🔎 Indexed {count} existing transcriptions for search")
+
+
+def fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query matching all words (a trailing * means prefix)"""
+    terms = re.findall(r'\w+\*?', text)
+    return ' '.join(f'"{t[:-1]}"*' if t.endswith('*') else f'"{t}"' for t in terms)
+
+
+def search_transcriptions(db_path, query: str, limit: int = 20, highlight: tuple = ('[', ']')) -> list:
+    """Return the best matches for query, most relevant first.
+
+    Each result is a dict with id, timestamp and a snippet in which matching
+    words are wrapped in the highlight markers.
+    """
+    match = fts_query(query)
+    if not match:
+        return []
+    conn = connect(db_path)
+    try:
+        rows = conn.execute('''
+            SELECT t.id, t.timestamp, snippet(transcriptions_fts, -1, ?, ?, '…', 16)
+            FROM transcriptions_fts
+            JOIN transcriptions t ON t.id = transcriptions_fts.rowid
+            WHERE transcriptions_fts MATCH ?
+            ORDER BY bm25(transcriptions_fts)
+            LIMIT ?
+        ''', (highlight[0], highlight[1], match, limit)).fetchall()
+    except sqlite3.OperationalError:
+        # No FTS5 in this SQLite build: plain substring scan, newest first
+        rows = conn.execute('''
+            SELECT id, timestamp, transcription FROM transcriptions
+            WHERE transcription LIKE ? ORDER BY id DESC LIMIT ?
+        ''', (f'%{query}%', limit)).fetchall()
+    finally:
+        conn.close()
+    return [{'id': row_id, 'timestamp': timestamp, 'snippet': snippet} for row_id, timestamp, snippet in rows]
+
+
+def history_page(db_path, cursor: tuple = None, since: str = None, until: str = None,
+                 page_size: int = 20) -> tuple:
+    """Return one page of history, newest first, and the cursor for the next page.
+
+    Pages are keyed on (created_at, id) rather than OFFSET, so fetching page N
+    costs the same as page 1. since is inclusive and until exclusive; both are
+    compared with created_at (UTC, e.g. '2024-05-01' or '2024-05-01 13:00').
+    The returned cursor is None on the last page.
+    """
+    clauses, params = [], []
+    if cursor is not None:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend(cursor)
+    if since:
+        clauses.append('created_at >= ?')
+        params.append(since)
+    if until:
+        clauses.append('created_at < ?')
+        params.append(until)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+
+    conn = connect(db_path)
+    try:
+        rows = conn.execute(f'''
+            SELECT id, timestamp, transcription, duration, created_at, status
+            FROM transcriptions {where}
+            ORDER BY created_at DESC, id DESC
+            LIMIT ?
+        ''', (*params, page_size)).fetchall()
+    finally:
+        conn.close()
+
+    page = [{'id': row_id, 'timestamp': timestamp, 'transcription': text, 'duration': duration,
+             'created_at': created_at, 'status': status}
+            for row_id, timestamp, text, duration, created_at, status in rows]
+    next_cursor = (page[-1]['created_at'], page[-1]['id']) if len(page) == page_size else None
+    return page, next_cursor
+
+
+def iter_history(db_path, since: str = None, until: str = None, page_size: int = 200):
+    """Yield every matching row, newest first, fetching one page at a time"""
+    cursor = None
+    while True:
+        page, cursor = history_page(db_path, cursor, since, until, page_size)
+        yield from page
+        if cursor is None:
+            return
+
+
+def pending_drafts(db_path, limit: int = 100) -> list:
+    """(id, audio_file) of the newest draft rows whose audio is still archived"""
+    conn = connect(db_path)
+    try:
+        return conn.execute('''
+            SELECT id, audio_file FROM transcriptions
+            WHERE status = 'draft' AND audio_file IS NOT NULL
+            ORDER BY id DESC LIMIT ?
+        ''', (limit,)).fetchall()
+    finally:
+        conn.close()
+
+
+def pending_summaries(db_path, limit: int = 20, upgrade_min_chars: int = None) -> list:
+    """(id, transcription) of the newest rows still waiting for a summary.
+
+    Drafts are skipped, since their text is about to change. With
+    upgrade_min_chars set, rows that only got an extractive summary and are
+    at least that long are included too, so they can be redone by the LLM.
+    """
+    conn = connect(db_path)
+    try:
+        return conn.execute('''
+            SELECT id, transcription FROM transcriptions
+            WHERE (status IS NULL OR status != 'draft')
+              AND (summary IS NULL OR (? IS NOT NULL AND summary_model = 'extractive'
+                                       AND length(transcription) >= ?))
+            ORDER BY id DESC LIMIT ?
+        ''', (upgrade_min_chars, upgrade_min_chars, limit)).fetchall()
+    finally:
+        conn.close()
+
+
+def encode_cursor(cursor: tuple) -> str:
+    """Render a page cursor as a token that can be passed back on the command line"""
+    return f'{cursor[0]}|{cursor[1]}'
+
+
+def decode_cursor(token: str) -> tuple:
+    created_at, row_id = token.rsplit('|', 1)
+    return created_at, int(row_id)
+
+
+class DatabaseWriter:
+    """Background thread that owns one long-lived connection and batches inserts.
+
+    Callers enqueue rows and get a Future for the new row id instead of
+    waiting on disk I/O. Rows arriving within batch_window of each other are
+    committed in a single transaction.
+    """
+
+    def __init__(self, db_path, batch_size: int = 64, batch_window: float = 0.2):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.queue = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def insert_transcription(self, transcription: str, duration: float, audio_file: str = None,
+                             speech_duration: float = None, stage_timings: dict = None,
+                             status: str = None) -> Future:
+        """Queue a transcription (and its stage timings); the Future resolves to the row id"""
+        future = Future()
+        row = (datetime.now().isoformat(), audio_file, transcription, duration, speech_duration, status)
+        self.queue.put(('insert', row, stage_timings or {}, future))
+        return future
+
+    def execute(self, sql: str, params: tuple = ()) -> Future:
+        """Queue any other write (e.g. an UPDATE); the Future resolves to the row count"""
+        future = Future()
+        self.queue.put(('execute', sql, params, future))
+        return future
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until everything queued so far is committed"""
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 5.0):
+        """Commit pending rows and stop the writer thread"""
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def _next_batch(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size and batch[-1] is not None and batch[-1][0] != 'flush':
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _apply(conn: sqlite3.Connection, item: tuple):
+        if item[0] == 'execute':
+            _, sql, params, _ = item
+            return conn.execute(sql, params).rowcount
+        _, row, stage_timings, _ = item
+        cursor = conn.execute('''
+            INSERT INTO transcriptions (timestamp, audio_file, transcription, duration, speech_duration, status)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', row)
+        conn.executemany(
+            'INSERT INTO stage_timings (transcription_id, stage, seconds) VALUES (?, ?, ?)',
+            [(cursor.lastrowid, stage, seconds) for stage, seconds in stage_timings.items()])
+        return cursor.lastrowid
+
+    def _apply_batch(self, conn: sqlite3.Connection, writes: list) -> list:
+        """Commit the batch in one transaction, each item in its own savepoint.
+
+        An item that fails is rolled back on its own and its exception is
+        returned in its place, so it can't take the rest of the batch with it.
+        """
+        results = []
+        with conn:
+            conn.execute('BEGIN')
+            for item in writes:
+                conn.execute('SAVEPOINT item')
+                try:
+                    results.append(self._apply(conn, item))
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO item')
+                    results.append(e)
+                conn.execute('RELEASE item')
+        return results
+
+    def _run(self):
+        conn = connect(self.db_path)
+        while True:
+            batch = self._next_batch()
+            writes = [item for item in batch if item is not None and item[0] != 'flush']
+            try:
+                results = self._apply_batch(conn, writes) if writes else []
+                for item, result in zip(writes, results):
+                    if isinstance(result, Exception):
+                        print(f"Error saving to database: {result}")
+                        item[-1].set_exception(result)
+                    else:
+                        item[-1].set_result(result)
+                inserts = sum(1 for item, result in zip(writes, results)
+                              if item[0] == 'insert' and not isinstance(result, Exception))
+                if inserts:
+                    print(f"✅ Saved {inserts} transcription(s) to database")
+            except Exception as e:
+                print(f"Error saving to database: {e}")
+                for item in writes:
+                    if not item[-1].done():
+                        item[-1].set_exception(e)
+
+            for item in batch:
+                if item is not None and item[0] == 'flush':
+                    item[1].set()
+            if batch[-1] is None:
+                conn.close()
+                return
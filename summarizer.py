@@ -0,0 +1,270 @@
+"""
+Background summaries for the transcription history.
+
+The transcriptions table is the work queue: every row whose summary is NULL
+still needs one, so nothing is lost across restarts. Summaries come from a
+local Ollama model when it is reachable and from simple_summarize()
+otherwise; those extractive ones are redone by the LLM once it is back.
+
+    python summarizer.py                    # fill the backlog once and exit
+    python summarizer.py --url http://127.0.0.1:11434 --model llama3.2
+"""
+import argparse
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+import storage
+
+DB_PATH = Path(os.path.expanduser('~')) / '.voz-pra-texto' / 'transcriptions.db'
+
+# Same configuration variables as the service
+OLLAMA_URL = os.environ.get('OLLAMA_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'llama3.2')
+OLLAMA_TIMEOUT = float(os.environ.get('OLLAMA_TIMEOUT', '60'))
+SUMMARY_MIN_CHARS = int(os.environ.get('SUMMARY_MIN_CHARS', '280'))
+
+SUMMARY_PROMPT = """You will receive a raw voice-note transcription.
+Summarize it **without changing my tone, wording style, or way of speaking**.
+
+Rules:
+* Keep my natural, spoken style (including informal phrasing).
+* Do NOT make it sound formal, written, or "polished".
+* Remove repetitions, filler, and tangents (e.g. "like", "you know", circular explanations).
+* Keep the original intent, emphasis, and ordering of ideas.
+* Do not add conclusions, interpretations, or new framing.
+
+Output format:
+* Short, clean paragraphs or bullet points
+* Same voice as the original, just clearer and tighter
+
+Transcription:
+{text}
+
+Cleaned up version:"""
+
+
+def simple_summarize(text: str) -> str:
+    """
+    Simple extractive summarization when LLM unavailable
+    Takes first 2-3 sentences as summary
+    """
+    sentences = text.split('. ')
+    summary = '. '.join(sentences[:3])
+    if len(summary) > 200:
+        summary = summary[:200] + "..."
+    return summary
+
+
+class OllamaClient:
+    """Ollama /api/generate over one pooled HTTP session.
+
+    Whether the server is up is cached: a good answer (health check or
+    summary) is trusted for health_ttl seconds, and after a failure it is
+    not asked again for 5 s, doubling on every further failure up to
+    max_backoff. summarize() returns None instead of raising.
+    """
+
+    def __init__(self, url: str = OLLAMA_URL, model: str = OLLAMA_MODEL, timeout: float = OLLAMA_TIMEOUT,
+                 health_ttl: float = 60, max_backoff: float = 300):
+        self.url = url.rstrip('/')
+        self.model = model
+        self.timeout = timeout
+        self.health_ttl = health_ttl
+        self.max_backoff = max_backoff
+        self.session = requests.Session()  # keeps the connection open between calls
+        self.healthy = False
+        self.failures = 0
+        self.next_check = 0.0  # time.monotonic() when health is looked at again
+
+    def available(self) -> bool:
+        if time.monotonic() < self.next_check:
+            return self.healthy
+        try:
+            response = self.session.get(f'{self.url}/api/tags', timeout=2)
+            if response.status_code == 200:
+                self._mark_up()
+            else:
+                self._mark_down(f"status {response.status_code}")
+        except requests.RequestException as e:
+            self._mark_down(type(e).__name__)
+        return self.healthy
+
+    def summarize(self, text: str) -> str:
+        if not self.available():
+            return None
+        try:
+            response = self.session.post(f'{self.url}/api/generate', json={
+                'model': self.model,
+                'prompt': SUMMARY_PROMPT.format(text=text),
+                'stream': False,
+                'options': {'temperature': 0.2},
+            }, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._mark_down(type(e).__name__)
+            return None
+        if response.status_code != 200:
+            self._mark_down(f"status {response.status_code}: {response.text[:200]}")
+            return None
+        self._mark_up()
+        return response.json().get('response', '').strip() or None
+
+    def retry_in(self) -> float:
+        """Seconds until the next health check is due"""
+        return max(0.0, self.next_check - time.monotonic())
+
+    def _mark_up(self):
+        if not self.healthy:
+            print(f"🦙 Ollama available at {self.url} ({self.model})")
+        self.healthy = True
+        self.failures = 0
+        self.next_check = time.monotonic() + self.health_ttl
+
+    def _mark_down(self, reason: str):
+        backoff = min(5.0 * 2 ** self.failures, self.max_backoff)
+        if self.healthy or self.failures == 0:
+            print(f"⚠️ Ollama unavailable ({reason}); using simple summaries, retrying in {backoff:.0f}s")
+        self.healthy = False
+        self.failures += 1
+        self.next_check = time.monotonic() + backoff
+
+
+class Summarizer:
+    """Background thread that fills the summary column.
+
+    submit() wakes it to work through rows without a summary, newest first,
+    batch_size at a time; it sleeps again once none are left. Texts shorter
+    than min_chars, and everything while the LLM is unreachable, get a
+    simple_summarize() summary; when that happened it looks again once the
+    client's backoff runs out, to redo them with the LLM. Nothing runs while
+    is_busy() is true. Summaries are written through the DatabaseWriter.
+    """
+
+    def __init__(self, db_path, writer, client: OllamaClient, batch_size: int = 20,
+                 min_chars: int = SUMMARY_MIN_CHARS, is_busy=None, busy_retry: float = 30):
+        self.db_path = db_path
+        self.writer = writer
+        self.client = client
+        self.batch_size = batch_size
+        self.min_chars = min_chars
+        self.is_busy = is_busy or (lambda: False)
+        self.busy_retry = busy_retry
+        self.cond = threading.Condition()
+        self.wanted = False
+        self.retry_at = None  # time.monotonic() to look at the backlog again without a submit()
+        self.closed = False
+        self.thread = None
+        self.counts = {'llm': 0, 'extractive': 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, *_):
+        """Note that rows may need a summary (also usable as a Future callback)"""
+        with self.cond:
+            self.wanted = True
+            self.cond.notify()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+
+    def status(self) -> str:
+        source = f"Ollama ({self.client.model})" if self.client.healthy else "extractive"
+        return f"Summaries: {source} ({self.counts['llm'] + self.counts['extractive']} this session)"
+
+    def _summarize(self, text: str) -> tuple:
+        """(summary, summary_model) for one transcription"""
+        if len(text) >= self.min_chars:
+            summary = self.client.summarize(text)
+            if summary:
+                return summary, self.client.model
+        return simple_summarize(text), 'extractive'
+
+    def drain(self) -> bool:
+        """Summarize until the backlog is empty; False if it had to stop early (busy or closed)"""
+        upgrade = self.client.available()
+        while not self.closed:
+            rows = storage.pending_summaries(self.db_path, self.batch_size, self.min_chars if upgrade else None)
+            if not rows:
+                return True
+            start = time.perf_counter()
+            writes = []
+            counts = {'llm': 0, 'extractive': 0}
+            fell_back = False
+            for row_id, text in rows:
+                if self.closed or self.is_busy():
+                    break
+                summary, source = self._summarize(text)
+                counts['extractive' if source == 'extractive' else 'llm'] += 1
+                fell_back = fell_back or (source == 'extractive' and len(text) >= self.min_chars)
+                # Skipped if the text changed meanwhile (e.g. refined); that row comes round again
+                writes.append(self.writer.execute(
+                    'UPDATE transcriptions SET summary = ?, summary_model = ? WHERE id = ? AND transcription = ?',
+                    (summary, source, row_id, text)))
+            for write in writes:
+                write.result(timeout=30)
+            if writes:
+                self.counts['llm'] += counts['llm']
+                self.counts['extractive'] += counts['extractive']
+                print(f"📝 Summarized {len(writes)} transcription(s) in {time.perf_counter() - start:.1f}s "
+                      f"({counts['llm']} by {self.client.model}, {counts['extractive']} extractive)")
+            if len(writes) < len(rows):
+                return False
+            if fell_back:
+                upgrade = False  # the LLM failed; finish with extractive summaries, or this page comes back
+        return False
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.closed and not self.wanted:
+                    timeout = None if self.retry_at is None else self.retry_at - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self.cond.wait(timeout)
+                if self.closed:
+                    return
+                self.wanted = False
+                self.retry_at = None
+            try:
+                finished = self.drain()
+            except Exception as e:
+                print(f"Summarization error: {e}")
+                finished = False
+            if not finished:
+                self.retry_at = time.monotonic() + self.busy_retry
+            elif not self.client.healthy:
+                # Extractive summaries may be waiting for the LLM to come back
+                self.retry_at = time.monotonic() + self.client.retry_in()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill in missing summaries in the Voice2Text history")
+    parser.add_argument('--db', default=str(DB_PATH))
+    parser.add_argument('--url', default=OLLAMA_URL, help="Ollama server")
+    parser.add_argument('--model', default=OLLAMA_MODEL)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--min-chars', type=int, default=SUMMARY_MIN_CHARS,
+                        help="shorter transcriptions get an extractive summary")
+    args = parser.parse_args()
+
+    storage.setup_database(args.db)
+    writer = storage.DatabaseWriter(args.db)
+    writer.start()
+    summarizer = Summarizer(args.db, writer, OllamaClient(args.url, args.model), args.batch_size, args.min_chars)
+    try:
+        summarizer.drain()
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopping")
+    finally:
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,315 @@
+"""
+Headless transcription daemon: one loaded model shared by local clients.
+
+Runs without a GUI or keyboard hooks (e.g. on a Linux box) and serves
+transcription over HTTP on localhost or on a Unix socket. Requests from all
+clients go through one queue; those arriving together with the same options
+are decoded as a batch.
+
+    python transcription_daemon.py                       # http://127.0.0.1:8765
+    python transcription_daemon.py --socket /tmp/voice2text.sock
+
+Clients select it with TRANSCRIPTION_ENGINE=daemon (and
+TRANSCRIPTION_DAEMON_URL, e.g. 'unix:///tmp/voice2text.sock').
+
+API:
+    GET  /health      model, device and queue statistics
+    POST /transcribe  body: 16 kHz mono float32 samples (application/octet-stream)
+                      or an audio file soundfile can read (any other type);
+                      query: options=<JSON transcribe options>, save=1 to add
+                      the result to the history. Returns the result as JSON.
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, quote, urlsplit
+
+import numpy as np
+
+from resample import resample
+
+SAMPLE_RATE = 16000
+DEFAULT_URL = 'http://127.0.0.1:8765'
+DB_PATH = Path(os.path.expanduser('~')) / '.voz-pra-texto' / 'transcriptions.db'
+
+# Same configuration variables as the service
+MODEL_NAME = os.environ.get('WHISPER_MODEL', 'small')
+ENGINE_NAME = os.environ.get('TRANSCRIPTION_ENGINE', 'whisper')
+CPU_QUANTIZE = os.environ.get('CPU_QUANTIZE', '0') == '1'
+CPU_THREADS = int(os.environ.get('CPU_THREADS', '0'))
+CPU_AFFINITY = os.environ.get('CPU_AFFINITY', '')
+
+
+class TranscriptionDaemon:
+    """Single worker that owns the engine and batches queued requests.
+
+    submit() returns a Future for the result. Jobs that arrive within
+    batch_window of each other and share the same options go to the engine
+    in one transcribe_batch() call.
+    """
+
+    def __init__(self, engine, batch_size: int = 8, batch_window: float = 0.05, writer=None):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.writer = writer  # storage.DatabaseWriter for save=1 requests, or None
+        self.queue = queue.Queue()
+        self.thread = None
+        self.served = 0
+        self.batches = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def submit(self, audio: np.ndarray, options: dict = None) -> Future:
+        future = Future()
+        self.queue.put((audio, options or {}, future))
+        return future
+
+    def close(self, timeout: float = 5.0):
+        self.queue.put(None)
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {'model': self.engine.model_name, 'engine': self.engine.name, 'device': self.engine.device,
+                'queued': self.queue.qsize(), 'served': self.served, 'batches': self.batches}
+
+    def _next_batch(self) -> list:
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_size and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _transcribe_group(self, jobs: list, options: dict):
+        try:
+            audios = [audio for audio, _, _ in jobs]
+            if len(audios) == 1:
+                results = [self.engine.transcribe(audios[0], **options)]
+            else:
+                results = self.engine.transcribe_batch(audios, **options)
+            for (_, _, future), result in zip(jobs, results):
+                future.set_result(result)
+        except Exception as e:
+            for _, _, future in jobs:
+                future.set_exception(e)
+        self.served += len(jobs)
+        self.batches += 1
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            groups = {}
+            for job in batch:
+                if job is not None:
+                    groups.setdefault(json.dumps(job[1], sort_keys=True), []).append(job)
+            for key, jobs in groups.items():
+                self._transcribe_group(jobs, json.loads(key))
+            if batch[-1] is None:
+                return
+
+
+def decode_request_audio(body: bytes, content_type: str) -> np.ndarray:
+    """Raw float32 samples as-is; anything else is read as an audio file"""
+    if content_type.split(';')[0].strip() == 'application/octet-stream':
+        return np.frombuffer(body, np.float32)
+    import soundfile as sf
+
+    audio, rate = sf.read(io.BytesIO(body), dtype='float32', always_2d=True)
+    return resample(audio.mean(axis=1), rate, SAMPLE_RATE)
+
+
+def to_response(result: dict) -> dict:
+    """Keep the JSON-safe part of an engine result"""
+    response = {
+        'text': result.get('text', ''),
+        'segments': [{'start': float(s['start']), 'end': float(s['end']), 'text': s['text']}
+                     for s in result.get('segments', [])],
+    }
+    for key in ('language', 'timings'):
+        if key in result:
+            response[key] = result[key]
+    return response
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    daemon = None  # TranscriptionDaemon, set by serve()
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlsplit(self.path).path == '/health':
+            self._send_json(200, self.daemon.stats())
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/transcribe':
+            self._send_json(404, {'error': 'not found'})
+            return
+        query = parse_qs(url.query)
+        try:
+            options = json.loads(query['options'][0]) if 'options' in query else {}
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            audio = decode_request_audio(body, self.headers.get('Content-Type', 'application/octet-stream'))
+        except Exception as e:
+            self._send_json(400, {'error': f'bad request: {e}'})
+            return
+
+        start = time.perf_counter()
+        try:
+            result = to_response(self.daemon.submit(audio, options).result())
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        result['seconds'] = time.perf_counter() - start
+        if query.get('save') == ['1'] and self.daemon.writer is not None and result['text'].strip():
+            row = self.daemon.writer.insert_transcription(result['text'].strip(), len(audio) / SAMPLE_RATE)
+            result['id'] = row.result(timeout=30)
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown the useful output
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects a (host, port) client address
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """http.client connection over a Unix socket"""
+
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class DaemonClient:
+    """Minimal client for the daemon ('http://host:port' or 'unix:///path/to.sock')"""
+
+    def __init__(self, url: str = DEFAULT_URL, timeout: float = 600):
+        self.url = url
+        self.timeout = timeout
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.url.startswith('unix://'):
+            return UnixHTTPConnection(self.url[len('unix://'):], self.timeout)
+        parsed = urlsplit(self.url)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _request(self, method: str, path: str, body: bytes = None, headers: dict = None) -> dict:
+        conn = self._connection()
+        try:
+            conn.request(method, path, body, headers or {})
+            response = conn.getresponse()
+            payload = json.loads(response.read())
+        finally:
+            conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"Transcription daemon error {response.status}: {payload.get('error')}")
+        return payload
+
+    def health(self) -> dict:
+        return self._request('GET', '/health')
+
+    def transcribe(self, audio: np.ndarray, save: bool = False, **options) -> dict:
+        path = f"/transcribe?options={quote(json.dumps(options))}" + ('&save=1' if save else '')
+        body = np.ascontiguousarray(audio, dtype=np.float32).tobytes()
+        return self._request('POST', path, body, {'Content-Type': 'application/octet-stream'})
+
+
+def serve(daemon: TranscriptionDaemon, host: str = '127.0.0.1', port: int = 8765, socket_path: str = None):
+    RequestHandler.daemon = daemon
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = UnixHTTPServer(socket_path, RequestHandler)
+        os.chmod(socket_path, 0o600)  # only this user's clients
+        print(f"🎧 Listening on unix://{socket_path}")
+    else:
+        if host not in ('127.0.0.1', 'localhost', '::1'):
+            print(f"⚠️ Listening on {host}: anyone who can reach it can use the model")
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        print(f"🎧 Listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️ Stopping")
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shared transcription model to local clients")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help="listen on this Unix socket instead of TCP")
+    parser.add_argument('--batch-size', type=int, default=8, help="most requests decoded together")
+    parser.add_argument('--batch-window', type=float, default=0.05,
+                        help="seconds to wait for more requests to batch with")
+    parser.add_argument('--db', default=str(DB_PATH), help="history database for save=1 requests")
+    args = parser.parse_args()
+
+    import storage
+    from engines import create_engine
+
+    if ENGINE_NAME == 'daemon':
+        parser.error("TRANSCRIPTION_ENGINE=daemon is for clients; pick the engine the daemon should run")
+    start = time.perf_counter()
+    print(f"Loading {ENGINE_NAME} model: {MODEL_NAME}")
+    engine = create_engine(ENGINE_NAME, MODEL_NAME, quantize=CPU_QUANTIZE, threads=CPU_THREADS,
+                           affinity=CPU_AFFINITY)
+    print(f"✅ {ENGINE_NAME} loaded on {engine.device} in {time.perf_counter() - start:.1f}s")
+
+    Path(args.db).parent.mkdir(parents=True, exist_ok=True)
+    storage.setup_database(args.db)
+    writer = storage.DatabaseWriter(args.db)
+    writer.start()
+    daemon = TranscriptionDaemon(engine, args.batch_size, args.batch_window, writer)
+    daemon.start()
+    try:
+        serve(daemon, args.host, args.port, args.socket)
+    finally:
+        daemon.close()
+        writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+def frame_energy_db(audio: np.ndarray, frame_len: int) -> np.ndarray:
+    """Return the RMS energy of each non-overlapping frame in dBFS"""
+    n = len(audio) // frame_len
+    frames = audio[:n * frame_len].reshape(n, frame_len)
+    power = np.einsum('ij,ij->i', frames, frames) / frame_len
+    return 10.0 * np.log10(power + 1e-10)
+
+
+def speech_mask(audio: np.ndarray, sample_rate: int, frame_ms: int = 30, margin_db: float = 15.0,
+                floor_db: float = -50.0, speech_db: float = -30.0) -> np.ndarray:
+    """Classify each frame as speech (True) or silence (False).
+
+    The threshold adapts to the recording: anything margin_db above the
+    estimated noise floor (10th percentile of frame energy) counts as speech,
+    but never below floor_db so a silent clip is not rescaled into "speech".
+    Frames louder than speech_db always count: in a noisy room, or when
+    there is no pause in the clip, the 10th percentile is speech itself.
+    """
+    frame_len = int(sample_rate * frame_ms / 1000)
+    energy = frame_energy_db(audio, frame_len)
+    if len(energy) == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = np.percentile(energy, 10)
+    return energy > min(max(noise_floor + margin_db, floor_db), speech_db)
+
+
+def trim_silence(audio: np.ndarray, sample_rate: int, frame_ms: int = 30, margin_db: float = 15.0,
+                 floor_db: float = -50.0, min_speech_ms: int = 250, pad_ms: int = 200,
+                 max_pause_ms: int = 1000, speech_db: float = -30.0) -> np.ndarray:
+    """Drop leading/trailing silence and shorten long internal pauses.
+
+    Returns an empty array only when the clip holds less than min_speech_ms
+    above floor_db, i.e. it is quiet in absolute terms; if the adaptive
+    threshold finds nothing in a louder clip, the clip is kept whole. If
+    there are no long pauses to collapse, the result is a view into audio
+    rather than a copy.
+    """
+    frame_len = int(sample_rate * frame_ms / 1000)
+    mask = speech_mask(audio, sample_rate, frame_ms, margin_db, floor_db, speech_db)
+    if mask.sum() * frame_ms < min_speech_ms:
+        if np.count_nonzero(frame_energy_db(audio, frame_len) > floor_db) * frame_ms < min_speech_ms:
+            return audio[:0]
+        return audio
+
+    # Pad each speech run so word onsets and trailing consonants survive
+    pad = max(int(pad_ms / frame_ms), 0)
+    if pad:
+        mask = np.convolve(mask, np.ones(2 * pad + 1, dtype=int), mode='same') > 0
+
+    # Boundaries of speech runs, in frames: starts[i] .. ends[i] (exclusive)
+    edges = np.diff(np.concatenate(([0], mask.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Merge runs separated by pauses short enough to keep verbatim; longer
+    # pauses are kept only up to max_pause_ms
+    max_pause = int(max_pause_ms / frame_ms)
+    long_gaps = np.flatnonzero(starts[1:] - ends[:-1] > max_pause)
+    run_starts = np.concatenate(([starts[0]], starts[long_gaps + 1]))
+    run_ends = np.concatenate((ends[long_gaps], [ends[-1]]))
+
+    last = len(audio) if run_ends[-1] == len(mask) else run_ends[-1] * frame_len
+    if len(run_starts) == 1:
+        return audio[run_starts[0] * frame_len:last]
+
+    keep = int(max_pause_ms * sample_rate / 1000)
+    pieces = []
+    for i, (start, end) in enumerate(zip(run_starts, run_ends)):
+        stop = last if i == len(run_starts) - 1 else end * frame_len + keep
+        pieces.append(audio[start * frame_len:stop])
+    return np.concatenate(pieces)
+
+
+def split_at_silences(audio: np.ndarray, sample_rate: int, chunk_seconds: float = 25.0,
+                      max_seconds: float = 30.0, overlap_seconds: float = 1.0, frame_ms: int = 30) -> list:
+    """Plan (start, end) sample ranges of at most max_seconds covering audio.
+
+    Each cut is placed at the quietest ~300 ms between half of chunk_seconds and
+    the maximum length, so it usually falls in a pause between words.
+    Neighbouring chunks overlap by overlap_seconds around the cut, so a word
+    the cut lands on still appears whole in one of them.
+    """
+    max_len = int(max_seconds * sample_rate)
+    if len(audio) <= max_len:
+        return [(0, len(audio))]
+
+    frame_len = int(sample_rate * frame_ms / 1000)
+    smooth = max(int(300 / frame_ms), 1)
+    energy = np.convolve(frame_energy_db(audio, frame_len), np.ones(smooth) / smooth, mode='same')
+    half_overlap = int(overlap_seconds * sample_rate / 2)
+
+    chunks = []
+    start = 0
+    while len(audio) - start > max_len:
+        lo = (start + int(chunk_seconds * sample_rate / 2)) // frame_len
+        hi = max((start + max_len - half_overlap) // frame_len, lo + 1)
+        cut = (lo + int(np.argmin(energy[lo:hi]))) * frame_len + frame_len // 2
+        chunks.append((start, cut + half_overlap))
+        start = cut - half_overlap
+    chunks.append((start, len(audio)))
+    return chunks